@@ -1,11 +1,14 @@
 import streamlit as st
-import pandas as pd
-import folium
-from folium import LayerControl, LatLngPopup
-from streamlit_folium import st_folium
 import os
-import gpxpy
-from app_fncs import prep_gpx, make_map, poi_fg, plot_layer_altair, parse_gpx, get_total_ascent
+from app_fncs import load_track, load_simplified_track, load_track_summary, make_map, make_overview_map, release_geojson, poi_fg, plot_layer_altair, MAP_DETAIL_ZOOM
+from validation import compare_to_gpx, walk_poi_proximity, PASS, FAIL
+from thumbnails import make_thumbnails
+from image_manifest import load_manifest, load_audit, walks_issues
+from rules import rule_matrix, failed_rules
+from walk_data import load_walk_data, release_walk_names, walk_pois, walk_images
+from profiling import Profiler
+from prefetch import prefetch, adjacent
+from warmup import start_warmup
 
 st.set_page_config(
     page_title="VAM content checker",
@@ -16,103 +19,144 @@ st.title('🥾 App content checker')
 st.write('## An app to help validate the data captured for each walk.')
 #st.write('### Current Phase: Release 1 - Walks 1-10')
 
-data_phase = st.selectbox('Select data capture phase... ', ('Release3', 'Release2', 'Release1'))
+# time each stage of this rerun, shown in the sidebar and logged as json lines
+profile = Profiler(trace_memory=st.sidebar.checkbox('Trace memory of each stage (slower)', value=False))
 
-# get walks data
-walks = pd.read_csv('WALKS.csv', usecols=['Name', 'ShortDescription', 'GeneralDescription', 'GeoJson', 'ShapeName', 'StartLocationLat', 'StartLocationLng', 'EndLocationLat', 'EndLocationLng', 'CoverImage', 
-'Duration', 'Distance', 'Grading', 'Height', 'Ascent', 'Gear', 'Safety','CarparkGettingStart',	'WayMarked', 'DogsAllowed', 'Facilities', 'Accessible', 'AccessibleToilet', 'AccessibleTerrainDescription', 'NearestCarpark', 'ToEvolveTech', 'CoverImageFile'])
-walks= walks.dropna(how='all')
-# lets only use rows that have gpx files for now
-#walks = walks.dropna(subset='GeoJson')
-# and only rows that are from the selected data phase
-walks = walks[walks.ToEvolveTech == data_phase]
-
-# get POI data 
-pois = pd.read_csv('POIs.csv')
-pois = pois.dropna(how='all')
-pois = pois.dropna(subset=['Latitude', 'Longitude'])
-
-# get images info
-images = pd.read_csv('IMAGES.csv')
-images = images.dropna(how='all')
+# newest release first, it is the one warmed up when the server starts
+RELEASES = ('Release3', 'Release2', 'Release1')
+data_phase = st.selectbox('Select data capture phase... ', RELEASES)
 
+# get walks, POI and images data, only re-read from disk when the csv files change
+with profile.stage('load sheets'):
+    data = load_walk_data()
 # set gpx folder location
 gpx_dir = r"./gpx/"
 
 # set images folder location
 img_dir = r"./images"
+# thumbnails shown per page of the image gallery, and per row
+GALLERY_PAGE_SIZE = 12
+GALLERY_COLUMNS = 4
+
+
+@st.cache_resource
+def server_warmup():
+    '''once per server process, load the current release into the caches in the background'''
+    return start_warmup(RELEASES[0], gpx_dir, img_dir, GALLERY_PAGE_SIZE)
+
+
+server_warmup()
 
 
-# get list of walks from data
-walklist  = list(walks.Name.unique())
+# get list of walks from data for the selected data phase
+walklist  = release_walk_names(data, data_phase)
+
+if st.toggle(f'Show every walk in {data_phase} on one map'):
+    # routes and sheet start points of the whole release, to spot misplaced starts
+    with profile.stage('overview map'):
+        # folium and streamlit_folium are only imported once a map is drawn, see warmup.py
+        from streamlit_folium import st_folium
+        release_walks = data.walks[data.walks['Name'].isin(walklist)]
+        overview = make_overview_map(release_walks, release_geojson(release_walks, gpx_dir))
+        st_folium(overview, width='100%', key='overview_map', returned_objects=[])
+
 selected_walk = st.selectbox(label='Select a walk from the dropdown list ...', options= walklist)
-# create filtered dataframes
-selected_walk_details = walks[walks['Name']==selected_walk]
-selected_walk_pois = pois[pois['WALK_Name']==selected_walk]
-selected_walk_imgs = images[images['Name']==selected_walk]
+if selected_walk is None:
+    st.write(f'There are no walks in {data_phase}')
+    st.stop()
+# look up the rows for the selected walk
+walk = data.walk_records[selected_walk]
+selected_walk_details = data.walk_rows[selected_walk]
+selected_walk_pois = walk_pois(data, selected_walk)
+selected_walk_imgs = walk_images(data, selected_walk)
+
 
+# sheet rules, evaluated for every walk at once and cached until the files change
+with profile.stage('sheet rules'):
+    rules = rule_matrix(gpx_dir=gpx_dir, img_dir=img_dir)
+for description in failed_rules(rules, selected_walk):
+    st.markdown(f'### :red[CHECK DATA!! Rule failed: {description}]')
+with st.expander(f'Rule checks for every walk in {data_phase}'):
+    st.dataframe(rules.loc[walklist])
 
-st.write('Short description:', '  \n', selected_walk_details.iloc[0,1])
-st.write('General description:', '  \n', selected_walk_details.iloc[0,2])
+st.write('Short description:', '  \n', walk.ShortDescription)
+st.write('General description:', '  \n', walk.GeneralDescription)
 st.dataframe(selected_walk_details)
 
-# if os.path.isfile(os.path.join(img_dir, str(selected_walk_details.iloc[0,26]))):
-#     # show cover image
-#     st.image(os.path.join(img_dir, selected_walk_details.iloc[0,26]), caption='Cover Image')
-# else:
-#     st.write(f'could not find image at {os.path.join(img_dir, selected_walk_details.iloc[0,26])}')
-#     st.write('No cover image for this walk')
+# size, dimensions and hash of every file in the images folder, rescanned only when the folder
+# changes, every few minutes for images overwritten in place, or when asked to
+rescan_images = st.sidebar.button('Rescan images', help='pick up images replaced under the same name straight away')
+with profile.stage('image manifest'):
+    manifest = load_manifest(img_dir, rescan=rescan_images)
+    img_mtimes = {os.path.join(img_dir, filename): mtime_ns for filename, mtime_ns in manifest['mtime_ns'].items()}
+
+if str(walk.CoverImageFile) in manifest.index:
+    # show cover image
+    cover_file = os.path.join(img_dir, walk.CoverImageFile)
+    cover_thumb = make_thumbnails([cover_file], mtimes=img_mtimes)
+    if cover_file in cover_thumb:
+        st.image(cover_thumb[cover_file], caption='Cover Image')
+else:
+    st.write(f'could not find cover image at {os.path.join(img_dir, str(walk.CoverImageFile))}')
+
+with st.expander(f'Image checks for every walk in {data_phase}'):
+    with profile.stage('image audit'):
+        audit = walks_issues(load_audit(manifest, data.walks, data.images), walklist)
+    st.dataframe(audit, hide_index=True)
 
 st.write('Table of POIs on this walk. (Also shown as points on the map.)') 
 st.dataframe(selected_walk_pois)
+if selected_walk_pois.shape[0] > 0:
+    # check the POIs are on or near the route
+    with profile.stage('poi proximity'):
+        poi_check = walk_poi_proximity(selected_walk, selected_walk_pois, data.walks, gpx_dir)
+    for id, row in poi_check[poi_check['status'] == FAIL].iterrows():
+        st.markdown(f'### :red[CHECK DATA!! POI {row["Title"]} is {row["route_distance_m"]:.0f}m from the route, more than {row["max_distance_m"]:.0f}m]')
 
 
-if len(str(selected_walk_details.GeoJson.iloc[0]))>1:
-            gpx_file= os.path.join(gpx_dir, str(selected_walk_details.GeoJson.iloc[0]))
+if len(str(walk.GeoJson))>1:
+            gpx_file= os.path.join(gpx_dir, str(walk.GeoJson))
             if os.path.isfile(gpx_file):
-                distances, elevations = parse_gpx(gpx_file)
-                elev_plot_layer_altair = plot_layer_altair(distances, elevations)
-                with st.container(height=150, border=None):
-                    #draw elevation plot
-                    st.altair_chart(elev_plot_layer_altair, use_container_width=True)
+                with profile.stage('gpx load and summary'):
+                    track = load_track(gpx_file)
+                    distances, elevations = track.dist, track.ele
+                    summary = load_track_summary(gpx_file)
+                with profile.stage('elevation chart'):
+                    elev_plot_layer_altair = plot_layer_altair(distances, elevations)
+                    with st.container(height=150, border=None):
+                        #draw elevation plot
+                        st.altair_chart(elev_plot_layer_altair, use_container_width=True)
+                # the html is only generated when the button is clicked
+                st.download_button('Download elevation profile (html)', data=elev_plot_layer_altair.to_html,
+                                   file_name=f'{selected_walk} elevation profile.html', mime='text/html')
                 
+                dist_check, elev_check, ascent_check = compare_to_gpx(summary, walk.Distance,
+                                                                      walk.Height, walk.Ascent)
+
                 # check distances
-                gpx_dist_km = round(max(distances),1)
-                data_dist_km = (int(selected_walk_details.iloc[0, 11]))/1000
-                dist_diff=abs((data_dist_km - gpx_dist_km) / float(data_dist_km) ) 
-                if dist_diff >=0.1:
+                gpx_dist_km, data_dist_km = dist_check.gpx_value, dist_check.data_value
+                if dist_check.status == FAIL:
                     st.markdown(f'### :red[CHECK DATA!! There is more than a 10% difference in total distance from the gpx file ({gpx_dist_km}km) compared to the data ({data_dist_km}km)]')
-                else:
+                elif dist_check.status == PASS:
                     st.markdown(f'#### :blue[Distances are within 10% of each other; gpx file has ({gpx_dist_km}km), data has ({data_dist_km}km)]')
+                else:
+                    st.markdown(f'### :red[Distance is not populated in the data]')
                 
                 # check max elevation
-                gpx_elev_max_m = round(max(elevations),1)
-                data_elev_max = (selected_walk_details.iloc[0, 13])
-                #print(data_elev_max.dtype, data_elev_max)
-                if data_elev_max > 0:
-                    elev_diff=abs((float(data_elev_max) - gpx_elev_max_m) / float(data_elev_max))
-                    if elev_diff >=0.1:
-                        st.markdown(f'### :red[CHECK DATA!! There is more than a 10% difference in highest point from the gpx file ({gpx_elev_max_m}m) compared to the data ({data_elev_max}m)]')
-                    else:
-                        st.markdown(f'#### :blue[Highest point are within 10% of each other; gpx file has ({gpx_elev_max_m}m), data has ({data_elev_max}m)]')
+                gpx_elev_max_m, data_elev_max = elev_check.gpx_value, elev_check.data_value
+                if elev_check.status == FAIL:
+                    st.markdown(f'### :red[CHECK DATA!! There is more than a 10% difference in highest point from the gpx file ({gpx_elev_max_m}m) compared to the data ({data_elev_max}m)]')
+                elif elev_check.status == PASS:
+                    st.markdown(f'#### :blue[Highest point are within 10% of each other; gpx file has ({gpx_elev_max_m}m), data has ({data_elev_max}m)]')
                 else:
                     st.markdown(f'### :red[Highest point is not populated in the data]')
                 
                 # Check total ascent
-                # Create a DataFrame 
-                data = pd.DataFrame({
-                    'Distance (km)': distances,
-                    'Elevation (m)': elevations
-                    })
-                gpx_ascent = round(get_total_ascent(data))
-                data_ascent = selected_walk_details.iloc[0, 14]
-                #print(data_ascent)
-                if data_ascent > 0:
-                    ascent_diff=abs((float(data_ascent) - gpx_ascent) / float(data_ascent))
-                    if ascent_diff >=0.1:
-                        st.markdown(f'### :red[CHECK DATA!! There is more than a 10% difference in total ascent from the gpx file ({gpx_ascent}m) compared to the data ({data_ascent}m)]')
-                    else:
-                        st.markdown(f'#### :blue[Total ascent are within 10% of each other; gpx file has ({gpx_ascent}m), data has ({data_ascent}m)]')
+                gpx_ascent, data_ascent = ascent_check.gpx_value, ascent_check.data_value
+                if ascent_check.status == FAIL:
+                    st.markdown(f'### :red[CHECK DATA!! There is more than a 10% difference in total ascent from the gpx file ({gpx_ascent}m) compared to the data ({data_ascent}m)]')
+                elif ascent_check.status == PASS:
+                    st.markdown(f'#### :blue[Total ascent are within 10% of each other; gpx file has ({gpx_ascent}m), data has ({data_ascent}m)]')
                 else:
                     st.markdown(f'### :red[Total ascent not populated in the data]')
             
@@ -122,49 +166,92 @@ col = st.columns((2, 5, 2), gap='medium')
 
 with col[0]:
     st.markdown('### Essential attributes')
-    st.metric(label='Route shape', value=selected_walk_details.iloc[0, 4])
-    st.metric(label='Duration', value=selected_walk_details.iloc[0, 10])
-    st.metric(label='Distance', value=selected_walk_details.iloc[0, 11])
-    st.metric(label='Grading', value=selected_walk_details.iloc[0, 12])
-    st.metric(label='Waymarker', value=selected_walk_details.iloc[0, 18])
-    st.metric(label='Dogs allowed', value=selected_walk_details.iloc[0, 19])
-    st.write('**Nearest carpark:** ', selected_walk_details.iloc[0, 24])
-    st.metric(label='Highest Point', value=selected_walk_details.iloc[0, 13])
-    st.metric(label='Ascent', value=selected_walk_details.iloc[0, 14])
-    st.metric(label='Facilities', value=selected_walk_details.iloc[0, 20])
+    st.metric(label='Route shape', value=walk.ShapeName)
+    st.metric(label='Duration', value=walk.Duration)
+    st.metric(label='Distance', value=walk.Distance)
+    st.metric(label='Grading', value=walk.Grading)
+    st.metric(label='Waymarker', value=walk.WayMarked)
+    st.metric(label='Dogs allowed', value=walk.DogsAllowed)
+    st.write('**Nearest carpark:** ', walk.NearestCarpark)
+    st.metric(label='Highest Point', value=walk.Height)
+    st.metric(label='Ascent', value=walk.Ascent)
+    st.metric(label='Facilities', value=walk.Facilities)
 
 with col[1]:
-    if len(str(selected_walk_details.GeoJson.iloc[0]))>1:
-        gpx_file= os.path.join(gpx_dir, str(selected_walk_details.GeoJson.iloc[0]))
+    if len(str(walk.GeoJson))>1:
+        gpx_file= os.path.join(gpx_dir, str(walk.GeoJson))
         if os.path.isfile(gpx_file):
-            gpx_pt_tpl, centre = prep_gpx(gpx_file)
-            start_point = [selected_walk_details.iloc[0, 5], selected_walk_details.iloc[0, 6]]
-            end_point = [selected_walk_details.iloc[0, 7], selected_walk_details.iloc[0, 8]]
-            map = make_map(gpx_pt_tpl, centre, start_point, end_point)
-            if selected_walk_pois.shape[0] > 0:
-                pois = poi_fg(selected_walk_pois)
-                map.add_child(pois)
-                LayerControl().add_to(map)
-                map.add_child(folium.LatLngPopup())
-                #folium.LatLngPopup().add_to(map)
-
-            st_data = st_folium(map, width='100%')
+            map_zoom = st.select_slider('Route detail (map zoom level it is drawn for)', options=[12, 13, 14, 15, 16, 17, 18, 'Full'], value=MAP_DETAIL_ZOOM)
+            with profile.stage('folium map'):
+                import folium
+                from folium import LayerControl
+                from streamlit_folium import st_folium
+                track = load_track(gpx_file)
+                route = load_simplified_track(gpx_file, None if map_zoom == 'Full' else map_zoom)
+                gpx_pt_tpl, centre = route.points, track.centre
+                start_point = [walk.StartLocationLat, walk.StartLocationLng]
+                end_point = [walk.EndLocationLat, walk.EndLocationLng]
+                map = make_map(gpx_pt_tpl, centre, start_point, end_point)
+                if selected_walk_pois.shape[0] > 0:
+                    pois = poi_fg(selected_walk_pois)
+                    map.add_child(pois)
+                    LayerControl().add_to(map)
+                    map.add_child(folium.LatLngPopup())
+                    #folium.LatLngPopup().add_to(map)
+
+            with profile.stage('st_folium'):
+                st_data = st_folium(map, width='100%')
+            st.caption(f'Route drawn with {len(route.indices)} of {route.original_vertices} gpx points '
+                       f'({route.reduction:.0%} fewer), max deviation {route.max_deviation_m:.1f}m')
         else:
             st.write('## No map available as there is no gpx listed for this walk in the data capture sheet')
 
 with col[2]:
     st.markdown('### Other attributes')
-    st.write('**Gear**: ', selected_walk_details.iloc[0, 15])
-    st.write('**Safety**: ', selected_walk_details.iloc[0, 16])
-    st.write('**Car Park getting started:** ', selected_walk_details.iloc[0, 17]) 
+    st.write('**Gear**: ', walk.Gear)
+    st.write('**Safety**: ', walk.Safety)
+    st.write('**Car Park getting started:** ', walk.CarparkGettingStart) 
 
 if selected_walk_imgs.shape[0] > 0:
     st.write(f'There are {selected_walk_imgs.shape[0]} images for this walk:') 
 
-    for id, row in selected_walk_imgs.iterrows():
-        if os.path.isfile(os.path.join(img_dir, row['FILENAME'])):
+    # show small thumbnails a page at a time, the full size image is only sent when asked for
+    n_pages = -(-selected_walk_imgs.shape[0] // GALLERY_PAGE_SIZE)
+    page = st.number_input('Page of images', min_value=1, max_value=n_pages, value=1) if n_pages > 1 else 1
+    page_imgs = selected_walk_imgs.iloc[(page - 1) * GALLERY_PAGE_SIZE:page * GALLERY_PAGE_SIZE]
+    with profile.stage('thumbnails'):
+        thumbs = make_thumbnails([os.path.join(img_dir, filename) for filename in page_imgs['FILENAME']], mtimes=img_mtimes)
+
+    with profile.stage('image gallery'):
+        gallery = st.columns(GALLERY_COLUMNS)
+        for i, (id, row) in enumerate(page_imgs.iterrows()):
+            img_file = os.path.join(img_dir, row['FILENAME'])
+            with gallery[i % GALLERY_COLUMNS]:
+                if img_file in thumbs:
+                    st.image(thumbs[img_file], caption=row['Title'])
+                else:
+                    st.write(f'could not find image at {img_file}')
+
+    # the options are rows of the sheet, so images sharing a title can each be picked
+    full_size = st.selectbox('Show an image at full resolution...', [None] + list(page_imgs.index),
+                             format_func=lambda id: 'None' if id is None else str(page_imgs.at[id, 'Title']))
+    if full_size is not None:
+        row = page_imgs.loc[full_size]
+        if os.path.join(img_dir, row['FILENAME']) in thumbs:
             st.image(os.path.join(img_dir, row['FILENAME']), caption=row['Title'])
-        else:
-            st.write(f'could not find image at {os.path.join(img_dir, row["FILENAME"])}')
 else:
     st.write('There are no images for this walk')
+
+# debug panel with where this rerun spent its time
+profile.close()
+profile.write_log(release=data_phase, walk=selected_walk)
+with st.sidebar.expander('Debug: rerun profile'):
+    st.write(f'Total {profile.total_ms:.0f}ms')
+    st.dataframe(profile.frame(), hide_index=True)
+
+
+# warm the caches for the walks either side of this one, so stepping through the list is quick.
+# Anything still queued from this session's previous selection is no longer needed
+if 'prefetch_job' in st.session_state:
+    st.session_state.prefetch_job.cancel()
+st.session_state.prefetch_job = prefetch(adjacent(walklist, selected_walk), data, gpx_dir, img_dir, GALLERY_PAGE_SIZE)
@@ -1,22 +1,177 @@
-import gpxpy
-import folium
-from folium import FeatureGroup, Marker
-
-import geopandas as gpd
+import heapq
+import io
+import os
+import sys
+import threading
+from collections import OrderedDict
+from typing import NamedTuple
+from xml.etree.ElementTree import iterparse
+
+import numpy as np
 import pandas as pd
 
-import altair as alt
+from track_store import TrackStore
+
+# gpxpy, folium and altair are imported inside the functions that use them, so
+# importing this module (the validation and store scripts, the prefetch worker)
+# doesn't pay for loading them until a map or chart is actually drawn
+
+# upper bound on the memory held by parsed tracks, shared by every session on the server
+TRACK_CACHE_MAX_BYTES = 64 * 1024 * 1024
+# zoom level the route line is simplified for by default, the map opens at zoom 14 so the
+# simplification stays below a pixel until the reviewer zooms in
+MAP_DETAIL_ZOOM = 15
+# most points drawn on the elevation profile, whatever the length of the walk
+PROFILE_MAX_POINTS = 500
+# zoom level the routes on the release overview map are simplified for
+OVERVIEW_ZOOM = 12
+
+
+class Track(NamedTuple):
+    '''compact, read only representation of a gpx track'''
+    lat: np.ndarray
+    lon: np.ndarray
+    ele: np.ndarray
+    dist: np.ndarray  # cumulative distance in km, same as parse_gpx
+    centre: list  # [lat, lon], same as prep_gpx
+    bounds: list  # [[south, west], [north, east]], as used by folium fit_bounds
+
+    @property
+    def nbytes(self):
+        return self.lat.nbytes + self.lon.nbytes + self.ele.nbytes + self.dist.nbytes
+
+    def points(self):
+        '''list of (lat, lon) pairs for folium'''
+        return np.column_stack((self.lat, self.lon)).tolist()
+
+
+class LRUCache:
+    '''thread safe least recently used cache, bounded by the total size of its values'''
+    def __init__(self, max_bytes, sizeof=sys.getsizeof):
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.total_bytes = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._items:
+                return None
+            self._items.move_to_end(key)
+            return self._items[key][0]
+
+    def put(self, key, value):
+        size = self.sizeof(value)
+        with self._lock:
+            if key in self._items:
+                self.total_bytes -= self._items.pop(key)[1]
+            self._items[key] = (value, size)
+            self.total_bytes += size
+            # always keep the newest entry, even if it is larger than the budget on its own
+            while self.total_bytes > self.max_bytes and len(self._items) > 1:
+                _, (_, evicted_size) = self._items.popitem(last=False)
+                self.total_bytes -= evicted_size
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.total_bytes = 0
+
+    def __len__(self):
+        return len(self._items)
+
+
+_track_cache = LRUCache(TRACK_CACHE_MAX_BYTES, sizeof=lambda track: track.nbytes)
+
+
+def _readonly(values):
+    arr = np.asarray(values, dtype=np.float64)
+    arr.flags.writeable = False
+    return arr
+
+
+def _local_name(tag):
+    # gpx 1.0 and 1.1 only differ in the namespace
+    return tag.rpartition('}')[2]
+
+
+def stream_track_points(file_path):
+    '''lat, lon and elevation (nan where missing) of every trkpt in a gpx file, as arrays.
+
+    Reads the same points as gpxpy.parse (every point of every segment of every
+    track, in order; waypoints and routes are skipped) without building its object
+    tree. The arrays are sized from a count of the trkpt tags and filled while the
+    xml is streamed, each point element being dropped once read.'''
+    with open(file_path, 'rb') as gpx_file:
+        data = gpx_file.read()
+    n = data.count(b'<trkpt') + data.count(b':trkpt')
+    lat, lon, ele = np.empty(n), np.empty(n), np.full(n, np.nan)
+
+    i = 0
+    parents = []
+    for event, elem in iterparse(io.BytesIO(data), events=('start', 'end')):
+        name = _local_name(elem.tag)
+        if event == 'start':
+            parents.append(elem)
+            continue
+        parents.pop()
+        if name == 'trkpt' and parents and _local_name(parents[-1].tag) == 'trkseg':
+            lat[i] = float(elem.get('lat'))
+            lon[i] = float(elem.get('lon'))
+            for child in elem:
+                if _local_name(child.tag) == 'ele' and child.text and child.text.strip():
+                    ele[i] = float(child.text)
+                    break
+            i += 1
+        # drop each point once read, and each top level element (track, waypoint, route...)
+        # once closed, so the tree never holds more than the point being read
+        if parents and (len(parents) == 1 or _local_name(parents[-1].tag) == 'trkseg'):
+            parents[-1].remove(elem)
+    return lat[:i], lon[:i], ele[:i]
+
+
+def parse_track_file(file_path):
+    '''parse a gpx file into a Track, without any caching'''
+    lat, lon, ele = (_readonly(values) for values in stream_track_points(file_path))
+    dist = _readonly(cumulative_distance(lat, lon, ele))
+    if len(lat) == 0:
+        # a file with no track points (only waypoints or a route, say) has no centre or bounds
+        return Track(lat, lon, ele, dist, None, None)
+    centre = [float(lat.mean()), float(lon.mean())]
+    bounds = [[float(lat.min()), float(lon.min())], [float(lat.max()), float(lon.max())]]
+    return Track(lat, lon, ele, dist, centre, bounds)
+
+
+_track_store = TrackStore()
+
+
+def load_track(file_path):
+    '''Load a gpx file as a Track, reusing the cached copy while the file is unchanged.
+
+    The cache lives at module level so it is shared across streamlit reruns and
+    sessions; entries are keyed by path and mtime and evicted least recently used
+    first once TRACK_CACHE_MAX_BYTES is exceeded. Tracks compiled into the binary
+    store (see track_store.py) are sliced from it instead of parsing the xml.'''
+    mtime_ns = os.stat(file_path).st_mtime_ns
+    key = (os.path.abspath(file_path), mtime_ns)
+    track = _track_cache.get(key)
+    if track is None:
+        stored = _track_store.get(file_path, mtime_ns)
+        if stored is not None:
+            arrays, entry = stored
+            track = Track(arrays['lat'], arrays['lon'], arrays['ele'], arrays['dist'], entry['centre'], entry['bounds'])
+        else:
+            track = parse_track_file(file_path)
+        _track_cache.put(key, track)
+    return track
+
 
 def prep_gpx(gpxData):
     '''adapted from 
     https://www.kaggle.com/code/paultimothymooney/overlay-gpx-route-on-osm-map-using-folium'''
-    gpx_file = open(gpxData, 'r')
-    gpx = gpxpy.parse(gpx_file)
-    gpx_pt_tpl = []
-    for track in gpx.tracks:
-        for segment in track.segments:        
-            for point in segment.points:
-                gpx_pt_tpl.append(tuple([point.latitude, point.longitude]))
+    lat, lon, _ = stream_track_points(gpxData)
+    gpx_pt_tpl = list(zip(lat.tolist(), lon.tolist()))
     latitude = sum(p[0] for p in gpx_pt_tpl)/len(gpx_pt_tpl)
     longitude = sum(p[1] for p in gpx_pt_tpl)/len(gpx_pt_tpl)
     centre = [latitude, longitude]
@@ -24,14 +179,164 @@ def prep_gpx(gpxData):
     return gpx_pt_tpl, centre
 
 
+# level of detail for the route line on the map
+class SimplifiedLine(NamedTuple):
+    points: list  # [lat, lon] pairs for folium
+    indices: np.ndarray  # positions of the kept points in the original track
+    original_vertices: int
+    max_deviation_m: float  # furthest any original point lies from the simplified line
+
+    @property
+    def reduction(self):
+        '''fraction of the vertices that were dropped'''
+        return 1 - len(self.indices) / self.original_vertices if self.original_vertices else 0.0
+
+
+def zoom_tolerance(zoom, latitude):
+    '''ground size in metres of one pixel of a web mercator map at the given zoom'''
+    return 2 * np.pi * EARTH_RADIUS * np.cos(np.radians(latitude)) / (256 * 2 ** zoom)
+
+
+def _segment_deviation(x, y, start, end):
+    '''distance of the points between start and end from the straight segment joining them'''
+    px, py = x[start + 1:end], y[start + 1:end]
+    dx, dy = x[end] - x[start], y[end] - y[start]
+    length_sq = dx * dx + dy * dy
+    if length_sq == 0:
+        return np.hypot(px - x[start], py - y[start])
+    t = np.clip(((px - x[start]) * dx + (py - y[start]) * dy) / length_sq, 0, 1)
+    return np.hypot(px - (x[start] + t * dx), py - (y[start] + t * dy))
+
+
+def simplify_line(lat, lon, tolerance_m=None, max_vertices=None):
+    '''Douglas-Peucker simplification of a track, by tolerance in metres and/or a vertex budget.
+
+    Segments are split worst first, so stopping at max_vertices keeps the points
+    that matter most. The distances for each split are computed with numpy over
+    the whole segment at once.'''
+    n = len(lat)
+    if n < 3:
+        return SimplifiedLine(np.column_stack((lat, lon)).tolist(), np.arange(n), n, 0.0)
+    # with no tolerance every point is kept up to the budget, even ones exactly on the line
+    tolerance_m = -1.0 if tolerance_m is None else tolerance_m
+    max_vertices = n if max_vertices is None else max(max_vertices, 2)
+
+    # local flat projection in metres, plenty accurate at the scale of a walk
+    coef = np.cos(np.radians(np.mean(lat)))
+    x = np.asarray(lon) * coef * ONE_DEGREE
+    y = np.asarray(lat) * ONE_DEGREE
+
+    keep = np.zeros(n, dtype=bool)
+    keep[[0, n - 1]] = True
+    heap = []
+
+    def push(start, end):
+        if end - start > 1:
+            deviation = _segment_deviation(x, y, start, end)
+            i = int(np.argmax(deviation))
+            heapq.heappush(heap, (-deviation[i], start, end, start + 1 + i))
+
+    push(0, n - 1)
+    vertices = 2
+    while heap and -heap[0][0] > tolerance_m and vertices < max_vertices:
+        _, start, end, split = heapq.heappop(heap)
+        keep[split] = True
+        vertices += 1
+        push(start, split)
+        push(split, end)
+
+    indices = np.flatnonzero(keep)
+    max_deviation = float(-heap[0][0]) if heap else 0.0
+    return SimplifiedLine(np.column_stack((lat[indices], lon[indices])).tolist(), indices, n, max_deviation)
+
+
+_simplified_cache = LRUCache(TRACK_CACHE_MAX_BYTES // 4, sizeof=lambda line: line.indices.nbytes * 3)
+
+
+def load_simplified_track(file_path, zoom=MAP_DETAIL_ZOOM, max_vertices=None):
+    '''route line of a gpx file simplified to below a pixel at the given zoom level (None for full detail)'''
+    key = (os.path.abspath(file_path), os.stat(file_path).st_mtime_ns, zoom, max_vertices)
+    line = _simplified_cache.get(key)
+    if line is None:
+        track = load_track(file_path)
+        tolerance = None if zoom is None or track.centre is None else zoom_tolerance(zoom, track.centre[0])
+        line = simplify_line(track.lat, track.lon, tolerance, max_vertices)
+        _simplified_cache.put(key, line)
+    return line
+
+
 def make_map(gpx_pt_tpl, centre, start_point, end_point):
+    import folium
     myMap = folium.Map(location=centre, zoom_start=14)
     folium.PolyLine(gpx_pt_tpl, color="red", weight=2.5, opacity=1).add_to(myMap)
     folium.Marker(start_point, icon=folium.Icon(color='green'), popup="start point", tooltip="Start point").add_to(myMap)
     folium.Marker(end_point, icon=folium.Icon(color='red'), popup="end point", tooltip="end point").add_to(myMap)
     return myMap
 
+_geojson_cache = LRUCache(TRACK_CACHE_MAX_BYTES // 4, sizeof=lambda geojson: geojson['n_points'] * 48)
+
+
+def release_geojson(walks, gpx_dir, zoom=OVERVIEW_ZOOM):
+    '''GeoJSON FeatureCollection of the simplified route of every walk in the frame.
+
+    Cached by walk name, gpx path and gpx mtime, so the collection for a release is
+    only rebuilt when one of its gpx files (or the list of walks) changes. Each
+    feature's properties hold the walk name and the start of the gpx track.'''
+    files = [(name, os.path.join(gpx_dir, str(gpx_name))) for name, gpx_name in zip(walks['Name'], walks['GeoJson'])]
+    files = [(name, gpx_file) for name, gpx_file in files if len(os.path.basename(gpx_file)) > 1 and os.path.isfile(gpx_file)]
+    key = (zoom, tuple((name, os.path.abspath(gpx_file), os.stat(gpx_file).st_mtime_ns) for name, gpx_file in files))
+    geojson = _geojson_cache.get(key)
+    if geojson is None:
+        features = []
+        for name, gpx_file in files:
+            track = load_track(gpx_file)
+            if len(track.lat) == 0:
+                continue
+            line = load_simplified_track(gpx_file, zoom)
+            features.append({
+                'type': 'Feature',
+                'properties': {'Name': name, 'gpx_start': [float(track.lat[0]), float(track.lon[0])]},
+                'geometry': {'type': 'LineString', 'coordinates': [[lon, lat] for lat, lon in line.points]},
+            })
+        geojson = {'type': 'FeatureCollection', 'features': features,
+                   'n_points': sum(len(f['geometry']['coordinates']) for f in features)}
+        _geojson_cache.put(key, geojson)
+    return geojson
+
+
+def make_overview_map(walks, geojson):
+    '''every route of a release on one map, with the start points from the sheet clustered'''
+    import folium
+    from folium import Marker
+    from folium.plugins import MarkerCluster
+    lat = pd.concat([walks['StartLocationLat']] + [pd.Series([c[1] for c in f['geometry']['coordinates']]) for f in geojson['features']]).dropna()
+    lon = pd.concat([walks['StartLocationLng']] + [pd.Series([c[0] for c in f['geometry']['coordinates']]) for f in geojson['features']]).dropna()
+    myMap = folium.Map(location=[lat.mean(), lon.mean()], zoom_start=10)
+    if len(lat):
+        myMap.fit_bounds([[lat.min(), lon.min()], [lat.max(), lon.max()]])
+
+    routes = {'type': 'FeatureCollection', 'features': geojson['features']}
+    folium.GeoJson(routes, name='Routes', style_function=lambda feature: {'color': 'red', 'weight': 2.5},
+                   tooltip=folium.GeoJsonTooltip(fields=['Name'])).add_to(myMap)
+
+    gpx_starts = {f['properties']['Name']: f['properties']['gpx_start'] for f in geojson['features']}
+    starts = MarkerCluster(name='Start points').add_to(myMap)
+    for name, start_lat, start_lng in zip(walks['Name'], walks['StartLocationLat'], walks['StartLocationLng']):
+        if pd.isna(start_lat) or pd.isna(start_lng):
+            continue
+        popup = name
+        if name in gpx_starts:
+            # how far the start in the sheet is from where the gpx track begins
+            gpx_lat, gpx_lng = gpx_starts[name]
+            gap_m = np.hypot(start_lat - gpx_lat, (start_lng - gpx_lng) * np.cos(np.radians(start_lat))) * ONE_DEGREE
+            popup = f'{name}<br>{gap_m:.0f}m from the start of the gpx track'
+        Marker([start_lat, start_lng], icon=folium.Icon(color='green'), tooltip=name, popup=popup).add_to(starts)
+    folium.LayerControl().add_to(myMap)
+    return myMap
+
+
 def poi_fg(poi_df):
+    from folium import FeatureGroup, Marker
     pois = FeatureGroup(name='POIs')
     for id, row in poi_df.iterrows():
         pois.add_child(Marker(location=[row['Latitude'], row['Longitude']], popup=row['Title']))
@@ -41,130 +346,31 @@ def poi_fg(poi_df):
 # functions for gpx checks and elevation graph profile
 # Function to parse the GPX file and extract elevation and distance
 def parse_gpx(file_path):
-    with open(file_path, 'r') as gpx_file:
-        gpx = gpxpy.parse(gpx_file)
+    import gpxpy.geo
+    lat, lon, ele = stream_track_points(file_path)
 
     # Extract elevations and distances from the track points
-    elevations = []
+    elevations = [None if np.isnan(e) else e for e in ele.tolist()]
     distances = []
     total_distance = 0
     previous_point = None
 
-    for track in gpx.tracks:
-        for segment in track.segments:
-            for point in segment.points:
-                elevations.append(point.elevation)
-                if previous_point is not None:
-                    distance = point.distance_3d(previous_point)
-                    total_distance += distance / 1000  # Convert to kilometers
-                distances.append(total_distance)
-                previous_point = point
+    for point in zip(lat.tolist(), lon.tolist(), elevations):
+        if previous_point is not None:
+            # same as point.distance_3d(previous_point) on the gpxpy objects
+            distance = gpxpy.geo.distance(*point, *previous_point)
+            total_distance += distance / 1000  # Convert to kilometers
+        distances.append(total_distance)
+        previous_point = point
     
     return distances, elevations
 
-# def get_total_ascent(data):
-#     data['elev_diff'] = data['Elevation (m)'].diff()
-#     ascents = data[data['elev_diff']>=0]
-#     total_ascent = ascents.elev_diff.sum()
-#     #print('ascent: ', total_ascent)
-#     # descents = data[data['elev_diff']<=0]
-#     # total_descent = descents.elev_diff.sum()*-1 
-#     # print('descent: ', total_descent)
-#     return total_ascent
-
-# # smoothing
-# def get_total_ascent(data, window=10):
-#     # Apply rolling mean to smooth elevation data
-#     data['smoothed_elevation'] = data['Elevation (m)'].rolling(window=window, min_periods=1).mean()
-
-#     # Calculate the differences in smoothed elevation
-#     data['elev_diff'] = data['smoothed_elevation'].diff()
-
-#     # Keep only positive elevation differences (ascents)
-#     ascents = data[data['elev_diff'] > 0]
-
-#     # Sum up the ascent values
-#     total_ascent = ascents['elev_diff'].sum()
-#     return total_ascent
-
-# # downsampling
-# def get_total_ascent(data, sample_rate=10):
-#     # Downsample the data by taking every Nth point
-#     data_sampled = data.iloc[::sample_rate]
-
-#     # Calculate the differences in elevation
-#     data_sampled['elev_diff'] = data_sampled['Elevation (m)'].diff()
-
-#     # Keep only positive elevation differences (ascents)
-#     ascents = data_sampled[data_sampled['elev_diff'] > 0]
-
-#     # Sum up the ascent values
-#     total_ascent = ascents['elev_diff'].sum()
-#     return total_ascent
-
-# # apply minimum change threshold
-# def get_total_ascent(data, threshold=0.0):
-#     # Calculate the differences in elevation
-#     data['elev_diff'] = data['Elevation (m)'].diff()
-
-#     # Apply a threshold to ignore small elevation changes
-#     data['elev_diff'] = data['elev_diff'].apply(lambda x: x if x > threshold else 0)
-
-#     # Keep only positive elevation differences (ascents)
-#     ascents = data[data['elev_diff'] > 0]
-
-#     # Sum up the ascent values
-#     total_ascent = ascents['elev_diff'].sum()
-#     return total_ascent
-
-# # smoothing and minimum threshold
-# tricky to get parameters that work in both mountainous and flatter settings
-# def get_total_ascent(data, window=1, threshold=1):
-#     # Apply rolling mean to smooth elevation data
-#     data['smoothed_elevation'] = data['Elevation (m)'].rolling(window=window, min_periods=1).mean()
-
-#     # Calculate the differences in smoothed elevation
-#     data['elev_diff'] = data['smoothed_elevation'].diff()
-
-#     # Apply a threshold to ignore small elevation changes
-#     data['elev_diff'] = data['elev_diff'].apply(lambda x: x if x > threshold else 0)
-
-#     # Keep only positive elevation differences (ascents)
-#     ascents = data[data['elev_diff'] > 0]
-
-#     # Sum up the ascent values
-#     total_ascent = ascents['elev_diff'].sum()
-#     return total_ascent
-
-# # vary threshold based on overall elevation profile
-# def get_total_ascent(data):
-#     # Calculate elevation range
-#     elevation_range = data['Elevation (m)'].max() - data['Elevation (m)'].min()
-
-#     # Adjust threshold dynamically based on elevation range
-#     if elevation_range < 50:  # relatively flat
-#         threshold = 1  # smaller threshold for flat terrain
-#     else:  # hilly or mountainous
-#         threshold = 5  # larger threshold for noisy, rugged terrain
-
-#     # Calculate the elevation differences
-#     data['elev_diff'] = data['Elevation (m)'].diff()
-
-#     # Apply dynamic threshold to filter small changes
-#     data['elev_diff'] = data['elev_diff'].apply(lambda x: x if x > threshold else 0)
-
-#     # Keep only positive elevation differences (ascents)
-#     ascents = data[data['elev_diff'] > 0]
-
-#     # Sum up the ascent values
-#     total_ascent = ascents['elev_diff'].sum()
-#     return total_ascent
-
+# the live ascent calculation, kept as the pandas reference for the vectorized
+# strategies further down (see ASCENT_STRATEGIES)
 # vary downsample based on overall elevation profile
 def get_total_ascent(data):
     # calculate length to node ratio
     len_node_ratio =  (data['Distance (km)'].max()*1000)/ data.shape[0]
-    print(len_node_ratio)
     # Calculate elevation range
     #elevation_range = data['Elevation (m)'].max() - data['Elevation (m)'].min()
 
@@ -194,25 +400,219 @@ def get_total_ascent(data):
     return total_ascent
 
 
-def plot_layer_altair(distances, elevations):
-    # Create a DataFrame for Altair
+# vectorized versions of the gpx checks, working on whole numpy arrays at once
+# same constants as gpxpy.geo
+EARTH_RADIUS = 6378.137 * 1000
+ONE_DEGREE = (2 * np.pi * EARTH_RADIUS) / 360
+
+
+class TrackSummary(NamedTuple):
+    distance_km: float
+    max_elevation_m: float
+    ascent_m: float
+
+
+def segment_lengths(lat, lon, ele):
+    '''length in metres of every segment between consecutive points.
+
+    Mirrors gpxpy.geo.distance (used by point.distance_3d) so results match parse_gpx:
+    a flat earth approximation including the elevation change, falling back to
+    haversine (ignoring elevation) for jumps of more than 0.2 degrees.'''
+    lat1, lat2 = lat[:-1], lat[1:]
+    lon1, lon2 = lon[:-1], lon[1:]
+    d_lat = lat1 - lat2
+    d_lon = lon1 - lon2
+
+    # gpxpy measures from the current point back to the previous one
+    coef = np.cos(np.radians(lat2))
+    distance_2d = np.sqrt(d_lat * d_lat + (d_lon * coef) ** 2) * ONE_DEGREE
+    d_ele = ele[1:] - ele[:-1]
+    lengths = np.where(np.isnan(d_ele) | (d_ele == 0), distance_2d, np.hypot(distance_2d, d_ele))
+
+    far = (np.abs(d_lat) > .2) | (np.abs(d_lon) > .2)
+    if far.any():
+        rlat1, rlat2 = np.radians(lat2[far]), np.radians(lat1[far])
+        a = np.sin((rlat1 - rlat2) / 2) ** 2 + \
+            np.sin(np.radians(lon2[far] - lon1[far]) / 2) ** 2 * np.cos(rlat1) * np.cos(rlat2)
+        lengths[far] = EARTH_RADIUS * 2 * np.arcsin(np.sqrt(a))
+    return lengths
+
+
+def cumulative_distance(lat, lon, ele):
+    '''cumulative distance in km at every point, starting at 0'''
+    dist = np.empty(len(lat))
+    if len(lat):
+        dist[0] = 0.0
+        np.cumsum(segment_lengths(lat, lon, ele) / 1000, out=dist[1:])
+    return dist
+
+
+def rolling_mean(values, window):
+    '''trailing rolling mean, equivalent to pandas rolling(window, min_periods=1).mean()'''
+    # each window is summed on its own rather than as a difference of running totals,
+    # whose rounding error grows along the track and can tip the ascent over a whole metre
+    valid = ~np.isnan(values)
+    kernel = np.ones(window)
+    sums = np.convolve(np.where(valid, values, 0.0), kernel)[:len(values)]
+    counts = np.convolve(valid.astype(float), kernel)[:len(values)]
+    with np.errstate(invalid='ignore'):
+        return sums / counts
+
+
+# the ascent is rounded to this many decimals, well below a metre but enough to drop the float
+# noise that otherwise decides which way an ascent ending in exactly .5 is rounded
+ASCENT_DECIMALS = 6
+
+
+def _positive_sum(elev_diff, threshold=0.0):
+    return round(float(elev_diff[elev_diff > threshold].sum()), ASCENT_DECIMALS)
+
+
+# ways of working out the total ascent from a noisy gpx elevation profile, by name.
+# Each takes the cumulative distances (km) and elevations (m) as arrays plus its own
+# parameters, benchmarks/bench_ascent.py compares them against the sheet
+ASCENT_STRATEGIES = {}
+# the strategy used by the app and the checks
+ASCENT_STRATEGY = 'node_ratio'
+
+
+def ascent_strategy(name):
+    def register(fnc):
+        ASCENT_STRATEGIES[name] = fnc
+        return fnc
+    return register
+
+
+@ascent_strategy('raw')
+def raw_ascent(distances, elevations):
+    '''sum of every rise between consecutive points'''
+    return _positive_sum(np.diff(elevations))
+
+
+@ascent_strategy('smoothing')
+def smoothed_ascent(distances, elevations, window=10):
+    '''rises of the rolling mean of the elevation'''
+    return _positive_sum(np.diff(rolling_mean(elevations, window)))
+
+
+@ascent_strategy('downsampling')
+def downsampled_ascent(distances, elevations, sample_rate=10):
+    '''rises between every Nth point'''
+    return _positive_sum(np.diff(elevations[::sample_rate]))
+
+
+@ascent_strategy('threshold')
+def threshold_ascent(distances, elevations, threshold=0.0):
+    '''rises larger than a minimum change'''
+    return _positive_sum(np.diff(elevations), threshold)
+
+
+@ascent_strategy('smoothing_threshold')
+def smoothed_threshold_ascent(distances, elevations, window=1, threshold=1.0):
+    '''rises of the rolling mean larger than a minimum change. Tricky to get parameters
+    that work in both mountainous and flatter settings'''
+    return _positive_sum(np.diff(rolling_mean(elevations, window)), threshold)
+
+
+@ascent_strategy('dynamic_threshold')
+def dynamic_threshold_ascent(distances, elevations, flat_range=50, flat_threshold=1.0, hilly_threshold=5.0):
+    '''minimum change picked from the elevation range, smaller for relatively flat walks'''
+    elevation_range = np.nanmax(elevations) - np.nanmin(elevations)
+    threshold = flat_threshold if elevation_range < flat_range else hilly_threshold
+    return _positive_sum(np.diff(elevations), threshold)
+
+
+@ascent_strategy('node_ratio')
+def node_ratio_ascent(distances, elevations, ratio=28, flat_window=30, hilly_window=5):
+    '''rolling mean window picked from the metres per gpx point, vectorized get_total_ascent'''
+    len_node_ratio = (distances.max() * 1000) / len(elevations)
+    window = flat_window if len_node_ratio < ratio else hilly_window
+    return _positive_sum(np.diff(rolling_mean(elevations, window)))
+
+
+def compute_ascent(distances, elevations, strategy=None, **params):
+    '''total ascent in metres using one of ASCENT_STRATEGIES, ASCENT_STRATEGY by default'''
+    distances = np.asarray(distances, dtype=np.float64)
+    elevations = np.asarray(elevations, dtype=np.float64)
+    if len(elevations) < 2:
+        return 0.0
+    return ASCENT_STRATEGIES[strategy or ASCENT_STRATEGY](distances, elevations, **params)
+
+
+def summarise_track(track):
+    '''distance, highest point and ascent of a Track, as used for the data checks'''
+    if len(track.dist) == 0:
+        return TrackSummary(0.0, float('nan'), 0.0)
+    return TrackSummary(float(track.dist[-1]), float(np.nanmax(track.ele)), compute_ascent(track.dist, track.ele))
+
+
+_summary_cache = LRUCache(TRACK_CACHE_MAX_BYTES // 64, sizeof=lambda summary: 64)
+
+
+def load_track_summary(file_path):
+    '''summarise_track of a gpx file, cached while the file is unchanged'''
+    key = (os.path.abspath(file_path), os.stat(file_path).st_mtime_ns, ASCENT_STRATEGY)
+    summary = _summary_cache.get(key)
+    if summary is None:
+        summary = summarise_track(load_track(file_path))
+        _summary_cache.put(key, summary)
+    return summary
+
+
+def lttb_indices(x, y, max_points):
+    '''Largest-Triangle-Three-Buckets downsampling, returns the positions of the points to keep.
+
+    The first and last points are always kept; in between, each bucket keeps the
+    point making the largest triangle with the previous kept point and the average
+    of the next bucket, so peaks and troughs survive the downsampling.'''
+    n = len(x)
+    if max_points >= n or max_points < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+
+    edges = np.linspace(1, n - 1, max_points - 1).astype(int)
+    keep = np.empty(max_points, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    # averages of every bucket, the last bucket's neighbour is the final point
+    next_x = np.append([x[start:end].mean() for start, end in zip(edges[1:-1], edges[2:])], x[-1])
+    next_y = np.append([np.nanmean(y[start:end]) for start, end in zip(edges[1:-1], edges[2:])], y[-1])
+
+    a = 0
+    for i, (start, end) in enumerate(zip(edges[:-1], edges[1:])):
+        area = np.abs((x[a] - next_x[i]) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (next_y[i] - y[a]))
+        a = start + int(np.nanargmax(area)) if not np.isnan(area).all() else start
+        keep[i + 1] = a
+    return keep
+
+
+def plot_layer_altair(distances, elevations, max_points=PROFILE_MAX_POINTS):
+    import altair as alt
+    # the ascent and axis range use every point, the chart itself only needs enough
+    # points to keep the shape of the profile
+    distances = np.asarray(distances, dtype=np.float64)
+    elevations = np.asarray(elevations, dtype=np.float64)
+    total_ascent = round(compute_ascent(distances, elevations))
+    keep = lttb_indices(distances, elevations, max_points)
+
+    # Create a DataFrame for Altair, shared by all the layers so it is only embedded once
     data = pd.DataFrame({
-        'Distance (km)': distances,
-        'Elevation (m)': elevations
+        'Distance (km)': distances[keep],
+        'Elevation (m)': elevations[keep]
     })
     # get y min and max for axis scale
-    y_min = data['Elevation (m)'].min()
-    #print(y_min)
-    y_max = data['Elevation (m)'].max() + 20
+    y_min = np.nanmin(elevations)
+    y_max = np.nanmax(elevations) + 20
 
-    total_ascent = round(get_total_ascent(data))
-    text = alt.Chart().mark_text(text=f"Total Ascent: {total_ascent}m", 
+    text = alt.Chart(alt.Data(values=[{}])).mark_text(text=f"Total Ascent: {total_ascent}m", 
                                  align='left',
                                  color='#052623',
                                  font='Myriad Pro Regular',
                                  ).encode(x=alt.datum(0), y=alt.datum(y_max))
 
-    area_chart = alt.Chart(data).mark_area(
+    base = alt.Chart()
+
+    area_chart = base.mark_area(
         color=alt.Gradient(
             gradient='linear',
             stops=[alt.GradientStop(color='#8DC63F', offset=0), # brown 8c564b darkgreen 2ca02c rust green #bcbd22
@@ -233,7 +633,7 @@ def plot_layer_altair(distances, elevations):
             )
     
 
-    line_chart_thick = alt.Chart(data).mark_line(
+    line_chart_thick = base.mark_line(
         ).encode(
             alt.X('Distance (km)'),
             alt.Y('Elevation (m)'),
@@ -241,7 +641,7 @@ def plot_layer_altair(distances, elevations):
             color=alt.value('#8DC63F')
         )
     
-    line_chart_thin = alt.Chart(data).mark_line(
+    line_chart_thin = base.mark_line(
         ).encode(
             alt.X('Distance (km)'),
             alt.Y('Elevation (m)'),
@@ -249,8 +649,8 @@ def plot_layer_altair(distances, elevations):
             color=alt.value('#052623')
         )
     
-    # chart =  area_chart + line_chart_thick + line_chart_thin + text
-    chart =  line_chart_thick + line_chart_thin + text
+    # chart =  alt.layer(area_chart, line_chart_thick, line_chart_thin, text, data=data)
+    chart =  alt.layer(line_chart_thick, line_chart_thin, text, data=data)
     chart = chart.properties(
         width="container",
         height= 150
@@ -274,8 +674,6 @@ def plot_layer_altair(distances, elevations):
     #    fill='#42A9C5',
     #    fillOpacity= 0.8
     )
-    chart.save('graph.html')
-
     return chart
 
 # def plot_cum_layer_altair(distances, elevations):
@@ -0,0 +1,90 @@
+'''Accuracy and runtime of every ascent strategy, over a sweep of their parameters.
+
+For every walk in WALKS.csv with a gpx file and a populated Ascent, each
+strategy in ASCENT_STRATEGIES is run with every parameter combination in
+PARAM_GRID. The error against the sheet and the time taken over all walks
+are reported, best first, so the live strategy can be chosen on evidence.
+
+Run from the repository root:
+    python -m benchmarks.bench_ascent [--output ascent_sweep.csv]
+'''
+import argparse
+import itertools
+import os
+import timeit
+
+import numpy as np
+import pandas as pd
+
+from app_fncs import ASCENT_STRATEGIES, ASCENT_STRATEGY, compute_ascent, load_track
+from validation import TOLERANCE
+from walk_data import read_walks
+
+PARAM_GRID = {
+    'raw': {},
+    'smoothing': {'window': [3, 5, 10, 20, 30, 50]},
+    'downsampling': {'sample_rate': [2, 5, 10, 20, 30]},
+    'threshold': {'threshold': [0.0, 0.5, 1.0, 2.0, 3.0, 5.0]},
+    'smoothing_threshold': {'window': [1, 5, 10, 20], 'threshold': [0.0, 0.5, 1.0, 2.0]},
+    'dynamic_threshold': {'flat_range': [30, 50, 100], 'flat_threshold': [0.5, 1.0], 'hilly_threshold': [2.0, 5.0]},
+    'node_ratio': {'ratio': [20, 28, 35], 'flat_window': [10, 20, 30], 'hilly_window': [3, 5, 10]},
+}
+
+
+def param_sets(grid):
+    names = list(grid)
+    for values in itertools.product(*grid.values()):
+        yield dict(zip(names, values))
+
+
+def load_walks(walks_file, gpx_dir):
+    '''(name, track, sheet ascent) for every walk that can be compared'''
+    walks = read_walks(walks_file)
+    walks = walks[walks['Ascent'].fillna(0) > 0]
+    found = []
+    for name, gpx_name, ascent in zip(walks['Name'], walks['GeoJson'], walks['Ascent']):
+        gpx_file = os.path.join(gpx_dir, str(gpx_name))
+        if os.path.isfile(gpx_file):
+            found.append((name, load_track(gpx_file), float(ascent)))
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--walks', default='WALKS.csv')
+    parser.add_argument('--gpx-dir', default='./gpx/')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help='write the full sweep to this csv')
+    args = parser.parse_args()
+
+    walks = load_walks(args.walks, args.gpx_dir)
+    expected = np.array([ascent for _, _, ascent in walks])
+    rows = []
+    for strategy in ASCENT_STRATEGIES:
+        for params in param_sets(PARAM_GRID.get(strategy, {})):
+            def run():
+                return [compute_ascent(track.dist, track.ele, strategy, **params) for _, track, _ in walks]
+            result = np.array(run())
+            rel_error = np.abs(result - expected) / expected
+            rows.append({
+                'strategy': strategy,
+                'params': ', '.join(f'{k}={v}' for k, v in params.items()),
+                'within_10pct': int((rel_error < TOLERANCE).sum()),
+                'median_rel_error': float(np.median(rel_error)),
+                'mean_abs_error_m': float(np.mean(np.abs(result - expected))),
+                'runtime_ms': min(timeit.repeat(run, number=1, repeat=args.repeat)) * 1000,
+            })
+
+    report = pd.DataFrame(rows).sort_values(['within_10pct', 'median_rel_error'], ascending=[False, True])
+    if args.output:
+        report.to_csv(args.output, index=False)
+    print(f'{len(walks)} walks with a gpx file and a populated Ascent, live strategy: {ASCENT_STRATEGY}\n')
+    with pd.option_context('display.max_rows', None, 'display.width', 200, 'display.float_format', '{:.3g}'.format):
+        print('best parameters of each strategy:')
+        print(report.groupby('strategy', sort=False).head(1).to_string(index=False))
+        print('\ntop 15 overall:')
+        print(report.head(15).to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+'''Micro-benchmark of the vectorized distance/ascent engine against the gpxpy path.
+
+For every file in gpx/ this times parse_gpx + get_total_ascent (the original,
+per point gpxpy distance) against cumulative_distance + compute_ascent
+on the same points, and checks that both give the same answers.
+
+Run from the repository root:
+    python -m benchmarks.bench_distance
+'''
+import argparse
+import glob
+import os
+import timeit
+
+import numpy as np
+import pandas as pd
+
+from app_fncs import parse_track_file, load_track, summarise_track, parse_gpx, get_total_ascent, cumulative_distance, compute_ascent
+
+
+def gpxpy_path(gpx_file):
+    distances, elevations = parse_gpx(gpx_file)
+    data = pd.DataFrame({'Distance (km)': distances, 'Elevation (m)': elevations})
+    return distances, elevations, get_total_ascent(data)
+
+
+def numpy_path(lat, lon, ele):
+    dist = cumulative_distance(lat, lon, ele)
+    return dist, ele, compute_ascent(dist, ele)
+
+
+def best_of(fnc, repeat):
+    return min(timeit.repeat(fnc, number=1, repeat=repeat))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--gpx-dir', default='gpx')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    rows = []
+    for gpx_file in sorted(glob.glob(os.path.join(args.gpx_dir, '**', '*.gpx'), recursive=True)):
+        track = load_track(gpx_file)
+        ref_dist, ref_ele, ref_ascent = gpxpy_path(gpx_file)
+        dist, ele, ascent = numpy_path(track.lat, track.lon, track.ele)
+        rows.append({
+            'file': os.path.relpath(gpx_file, args.gpx_dir),
+            'points': len(dist),
+            'gpxpy_ms': best_of(lambda: gpxpy_path(gpx_file), args.repeat) * 1000,
+            # the gpxpy timing includes the xml parse, so time the array path from the xml too
+            'numpy_ms': best_of(lambda: summarise_track(parse_track_file(gpx_file)), args.repeat) * 1000,
+            'engine_ms': best_of(lambda: numpy_path(track.lat, track.lon, track.ele), args.repeat) * 1000,
+            'max_dist_diff_m': float(np.max(np.abs(dist - np.asarray(ref_dist)))) * 1000,
+            'max_elev_diff_m': abs(float(np.nanmax(ele)) - max(ref_ele)),
+            'ascent_diff_m': abs(ascent - ref_ascent),
+        })
+
+    report = pd.DataFrame(rows)
+    report['speedup'] = report['gpxpy_ms'] / report['numpy_ms']
+    with pd.option_context('display.max_rows', None, 'display.width', 200, 'display.float_format', '{:.4g}'.format):
+        print(report.to_string(index=False))
+    print(f"\ntotal gpxpy {report['gpxpy_ms'].sum():.1f}ms, numpy {report['numpy_ms'].sum():.1f}ms, "
+          f"engine only {report['engine_ms'].sum():.1f}ms")
+    print(f"worst differences: distance {report['max_dist_diff_m'].max():.3g}m, "
+          f"highest point {report['max_elev_diff_m'].max():.3g}m, ascent {report['ascent_diff_m'].max():.3g}m")
+
+
+if __name__ == '__main__':
+    main()
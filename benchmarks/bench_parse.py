@@ -0,0 +1,75 @@
+'''Parity, time and peak memory of the streaming gpx parser against gpxpy.parse.
+
+For every file in gpx/ the points read by stream_track_points are compared
+with the trkpt latitude, longitude and elevation of the gpxpy object tree,
+which must match exactly. Both parsers are then timed, and their peak memory
+measured with tracemalloc.
+
+Run from the repository root:
+    python -m benchmarks.bench_parse
+'''
+import argparse
+import glob
+import os
+import sys
+import timeit
+import tracemalloc
+
+import gpxpy
+import numpy as np
+import pandas as pd
+
+from app_fncs import stream_track_points
+
+
+def gpxpy_points(gpx_file):
+    with open(gpx_file, 'r') as f:
+        gpx = gpxpy.parse(f)
+    points = [point for track in gpx.tracks for segment in track.segments for point in segment.points]
+    return ([point.latitude for point in points], [point.longitude for point in points],
+            [np.nan if point.elevation is None else point.elevation for point in points])
+
+
+def peak_kb(fnc):
+    tracemalloc.start()
+    try:
+        fnc()
+        return tracemalloc.get_traced_memory()[1] / 1024
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--gpx-dir', default='gpx')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    rows = []
+    for gpx_file in sorted(glob.glob(os.path.join(args.gpx_dir, '**', '*.gpx'), recursive=True)):
+        expected = gpxpy_points(gpx_file)
+        found = stream_track_points(gpx_file)
+        rows.append({
+            'file': os.path.relpath(gpx_file, args.gpx_dir),
+            'points': len(found[0]),
+            'parity': all(np.array_equal(np.asarray(a, dtype=float), b, equal_nan=True) for a, b in zip(expected, found)),
+            'gpxpy_ms': min(timeit.repeat(lambda: gpxpy_points(gpx_file), number=1, repeat=args.repeat)) * 1000,
+            'stream_ms': min(timeit.repeat(lambda: stream_track_points(gpx_file), number=1, repeat=args.repeat)) * 1000,
+            'gpxpy_peak_kb': peak_kb(lambda: gpxpy_points(gpx_file)),
+            'stream_peak_kb': peak_kb(lambda: stream_track_points(gpx_file)),
+        })
+
+    report = pd.DataFrame(rows)
+    report['speedup'] = report['gpxpy_ms'] / report['stream_ms']
+    with pd.option_context('display.max_rows', None, 'display.width', 200, 'display.float_format', '{:.4g}'.format):
+        print(report.to_string(index=False))
+    print(f"\ntotal gpxpy {report['gpxpy_ms'].sum():.1f}ms, streaming {report['stream_ms'].sum():.1f}ms")
+    mismatched = report.loc[~report['parity'], 'file']
+    if len(mismatched):
+        print('points differ from gpxpy in: ' + ', '.join(mismatched))
+        sys.exit(1)
+    print(f'all {len(report)} files match gpxpy')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,229 @@
+'''End to end benchmark of the app's building blocks on a synthetic catalogue.
+
+Each case runs over every walk of the synthetic data (see benchmarks/synthetic.py,
+generated on first use) and records its throughput in items a second, the best
+of --repeat runs. It then runs again under tracemalloc, on the walks with the
+longest routes, for its peak memory:
+    parse_gpx, prep_gpx       every gpx file
+    get_total_ascent          the frame parse_gpx gives for every gpx file
+    make_map                  building and rendering the map of every walk
+    poi_fg                    the POI layer of every walk with POIs
+    plot_layer_altair         building and serialising the elevation chart of every walk
+    full_page                 the app script, opened and then switched to --page-reruns walks
+
+The results are compared with the baseline file, and the suite exits with an
+error listing every case slower or bigger than the tolerances allow. Record a
+new baseline on the reference machine with --save-baseline:
+    python -m benchmarks.bench_suite [--scale 10] [--save-baseline]
+'''
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+import pandas as pd
+
+from benchmarks.synthetic import generate
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+APP_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app.py')
+# a case fails when its throughput drops, or its peak memory grows, by more than this
+THROUGHPUT_TOLERANCE = 0.2
+MEMORY_TOLERANCE = 0.2
+# tracemalloc slows everything down several times, so peak memory is measured on the longest routes only
+MEMORY_WALKS = 20
+
+CASES = {}
+
+
+def case(name):
+    '''register a benchmark case: a function of the prepared context returning the number of items it did'''
+    def register(fnc):
+        CASES[name] = fnc
+        return fnc
+    return register
+
+
+def prepare(page_reruns):
+    '''everything the cases need that isn't being measured, one dict per walk with a gpx file,
+    read from the current directory'''
+    from app_fncs import parse_gpx, prep_gpx
+    from walk_data import load_walk_data, walk_pois
+
+    data = load_walk_data()
+    walks = []
+    for name in data.walks['Name']:
+        walk = data.walk_records[name]
+        gpx_file = os.path.join('gpx', str(walk.GeoJson))
+        if not os.path.isfile(gpx_file):
+            continue
+        distances, elevations = parse_gpx(gpx_file)
+        walks.append({
+            'walk': walk,
+            'gpx_file': gpx_file,
+            'profile': pd.DataFrame({'Distance (km)': distances, 'Elevation (m)': elevations}),
+            'route': prep_gpx(gpx_file),
+            'pois': walk_pois(data, name),
+        })
+    return {'walks': walks, 'page_reruns': page_reruns}
+
+
+def largest(context, n):
+    '''the context cut down to the n walks with the most gpx points, which set the peak memory'''
+    walks = sorted(context['walks'], key=lambda walk: len(walk['profile']), reverse=True)[:n]
+    return {**context, 'walks': walks}
+
+
+@case('parse_gpx')
+def bench_parse_gpx(context):
+    from app_fncs import parse_gpx
+    for walk in context['walks']:
+        parse_gpx(walk['gpx_file'])
+    return len(context['walks'])
+
+
+@case('prep_gpx')
+def bench_prep_gpx(context):
+    from app_fncs import prep_gpx
+    for walk in context['walks']:
+        prep_gpx(walk['gpx_file'])
+    return len(context['walks'])
+
+
+@case('get_total_ascent')
+def bench_get_total_ascent(context):
+    from app_fncs import get_total_ascent
+    for walk in context['walks']:
+        get_total_ascent(walk['profile'])
+    return len(context['walks'])
+
+
+@case('make_map')
+def bench_make_map(context):
+    from app_fncs import make_map
+    for walk in context['walks']:
+        points, centre = walk['route']
+        record = walk['walk']
+        make_map(points, centre, [record.StartLocationLat, record.StartLocationLng],
+                 [record.EndLocationLat, record.EndLocationLng]).get_root().render()
+    return len(context['walks'])
+
+
+@case('poi_fg')
+def bench_poi_fg(context):
+    from app_fncs import poi_fg
+    with_pois = [walk['pois'] for walk in context['walks'] if len(walk['pois'])]
+    for pois in with_pois:
+        poi_fg(pois)
+    return len(with_pois)
+
+
+@case('plot_layer_altair')
+def bench_plot_layer_altair(context):
+    from app_fncs import plot_layer_altair
+    for walk in context['walks']:
+        plot_layer_altair(walk['profile']['Distance (km)'], walk['profile']['Elevation (m)']).to_dict()
+    return len(context['walks'])
+
+
+@case('full_page')
+def bench_full_page(context):
+    from streamlit.testing.v1 import AppTest
+
+    def walk_select():
+        return next(select for select in at.selectbox if select.label.startswith('Select a walk'))
+
+    at = AppTest.from_file(APP_FILE, default_timeout=600)
+    at.run()
+    names = walk_select().options[1:context['page_reruns'] + 1]
+    for name in names:
+        walk_select().set_value(name)
+        at.run()
+    if at.exception:
+        raise RuntimeError(f'the app failed: {at.exception[0].value}')
+    return 1 + len(names)
+
+
+def run_case(fnc, context, memory_walks=MEMORY_WALKS, repeat=1):
+    '''items a second over every walk (the fastest of repeat runs), then peak memory in a
+    traced run over the largest walks'''
+    seconds = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        items = fnc(context)
+        seconds = min(seconds, time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        fnc(largest(context, memory_walks))
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {'items': items, 'seconds': seconds, 'items_per_s': items / seconds, 'peak_kb': peak / 1024}
+
+
+def regressions(results, baseline, throughput_tolerance=THROUGHPUT_TOLERANCE, memory_tolerance=MEMORY_TOLERANCE):
+    '''a message for every case that got slower or bigger than the baseline allows'''
+    found = []
+    for name, result in results.items():
+        base = baseline.get('cases', {}).get(name)
+        if base is None:
+            continue
+        if result['items_per_s'] < base['items_per_s'] * (1 - throughput_tolerance):
+            found.append(f"{name}: {result['items_per_s']:.3g} items/s, baseline {base['items_per_s']:.3g}")
+        if result['peak_kb'] > base['peak_kb'] * (1 + memory_tolerance):
+            found.append(f"{name}: peak {result['peak_kb']:.0f}KB, baseline {base['peak_kb']:.0f}KB")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', type=int, default=10)
+    parser.add_argument('--data-dir', help='synthetic data to run on, defaults to synthetic_data_<scale>x')
+    parser.add_argument('--cases', nargs='*', choices=list(CASES), default=list(CASES))
+    parser.add_argument('--page-reruns', type=int, default=5, help='walks the full page is switched to after opening')
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs of each case, the fastest counts')
+    parser.add_argument('--memory-walks', type=int, default=MEMORY_WALKS, help='longest routes the peak memory is measured on')
+    parser.add_argument('--baseline', default=BASELINE_FILE)
+    parser.add_argument('--save-baseline', action='store_true', help='record these results as the baseline')
+    args = parser.parse_args()
+
+    data_dir = args.data_dir or f'synthetic_data_{args.scale}x'
+    if not os.path.isdir(data_dir):
+        print(f'generating {args.scale}x synthetic data in {data_dir}')
+        generate(args.scale, data_dir)
+    # the app reads its files relative to where it runs, and shouldn't log or warm up while measured
+    os.environ['VAM_PROFILE_LOG'] = ''
+    os.environ['VAM_WARMUP'] = '0'
+    os.chdir(data_dir)
+
+    context = prepare(args.page_reruns)
+    results = {}
+    for name in args.cases:
+        results[name] = run_case(CASES[name], context, args.memory_walks, args.repeat)
+        print(f"{name:>18}: {results[name]['items']:5d} items in {results[name]['seconds']:7.2f}s, "
+              f"{results[name]['items_per_s']:8.3g} items/s, peak {results[name]['peak_kb']:9.0f}KB")
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump({'scale': args.scale, 'walks': len(context['walks']), 'cases': results}, f, indent=1)
+        print(f'baseline written to {args.baseline}')
+        return
+    try:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    except FileNotFoundError:
+        print(f'no baseline at {args.baseline}, record one with --save-baseline')
+        return
+    if baseline.get('scale') != args.scale:
+        print(f"baseline was recorded at {baseline.get('scale')}x, these results are {args.scale}x")
+    found = regressions(results, baseline)
+    if found:
+        print('\nPERFORMANCE REGRESSION\n' + '\n'.join(found))
+        sys.exit(1)
+    print('\nno regressions against the baseline')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+'''Checks of the vectorized numerics against straightforward reference versions.
+
+The fast implementations are easy to get subtly wrong at the edges (the first
+and last points, the blocks and diagonals they are cut into), so each is
+compared with a brute force version on random lines and the real gpx files:
+    hausdorff          the full pairwise distance matrix
+    discrete_frechet   the coupling table filled one cell at a time
+    lttb_indices       first and last points kept, one sorted point per bucket
+    simplify_line      every dropped point within the tolerance of the simplified line
+    compute_ascent     rounds to the same metre as get_total_ascent
+    stream_track_points  exactly the points gpxpy.parse reads
+
+Run from the repository root, it exits with an error if any check fails:
+    python -m benchmarks.check_numerics [--lines 200]
+'''
+import argparse
+import glob
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from app_fncs import (compute_ascent, get_total_ascent, lttb_indices, parse_gpx, simplify_line,
+                      stream_track_points, zoom_tolerance, _segment_deviation, ONE_DEGREE)
+from benchmarks.bench_parse import gpxpy_points
+from route_changes import hausdorff, discrete_frechet
+
+# allowed difference between a vectorized result and its reference, in metres
+ATOL = 1e-6
+
+
+def ref_hausdorff(p, q):
+    d = np.hypot(p[:, None, 0] - q[None, :, 0], p[:, None, 1] - q[None, :, 1])
+    return max(d.min(axis=1).max(), d.min(axis=0).max())
+
+
+def ref_frechet(p, q):
+    n, m = len(p), len(q)
+    ca = np.zeros((n, m))
+    for i in range(n):
+        for j in range(m):
+            d = np.hypot(*(p[i] - q[j]))
+            if i == 0 and j == 0:
+                ca[i, j] = d
+            elif i == 0:
+                ca[i, j] = max(ca[0, j - 1], d)
+            elif j == 0:
+                ca[i, j] = max(ca[i - 1, 0], d)
+            else:
+                ca[i, j] = max(min(ca[i - 1, j], ca[i - 1, j - 1], ca[i, j - 1]), d)
+    return ca[-1, -1]
+
+
+def random_line(rng, n):
+    '''a random walk in metres, like a short gpx track'''
+    return np.cumsum(rng.normal(0, 10, (n, 2)), axis=0)
+
+
+def check_distances(rng, lines):
+    failures = []
+    for _ in range(lines):
+        p, q = random_line(rng, rng.integers(1, 40)), random_line(rng, rng.integers(1, 40))
+        if abs(discrete_frechet(p, q) - ref_frechet(p, q)) > ATOL:
+            failures.append(f'discrete_frechet differs on lines of {len(p)} and {len(q)} points')
+        # lines longer than a block of the pairwise matrix, some of them
+        p, q = random_line(rng, rng.integers(1, 300)), random_line(rng, rng.integers(1, 300))
+        if abs(hausdorff(p, q, block=64) - ref_hausdorff(p, q)) > ATOL:
+            failures.append(f'hausdorff differs on lines of {len(p)} and {len(q)} points')
+    return failures
+
+
+def check_lttb(name, x, y, max_points):
+    keep = lttb_indices(x, y, max_points)
+    n = len(x)
+    if max_points >= n or max_points < 3:
+        return [] if np.array_equal(keep, np.arange(n)) else [f'lttb_indices dropped points of {name} below the budget']
+    edges = np.linspace(1, n - 1, max_points - 1).astype(int)
+    if len(keep) != max_points or keep[0] != 0 or keep[-1] != n - 1:
+        return [f'lttb_indices of {name} kept {len(keep)} points from {keep[0]} to {keep[-1]}']
+    if np.any(np.diff(keep) <= 0):
+        return [f'lttb_indices of {name} are not strictly increasing']
+    if np.any(keep[1:-1] < edges[:-1]) or np.any(keep[1:-1] >= edges[1:]):
+        return [f'lttb_indices of {name} kept a point outside its bucket']
+    return []
+
+
+def check_simplify(name, lat, lon, tolerance_m, max_vertices=None):
+    line = simplify_line(lat, lon, tolerance_m, max_vertices)
+    coef = np.cos(np.radians(np.mean(lat)))
+    x, y = np.asarray(lon) * coef * ONE_DEGREE, np.asarray(lat) * ONE_DEGREE
+    deviation = max((_segment_deviation(x, y, start, end).max(initial=0.0)
+                     for start, end in zip(line.indices[:-1], line.indices[1:])), default=0.0)
+    failures = []
+    if line.indices[0] != 0 or line.indices[-1] != len(lat) - 1 or np.any(np.diff(line.indices) <= 0):
+        failures.append(f'simplify_line of {name} lost an end point or is out of order')
+    if abs(deviation - line.max_deviation_m) > ATOL:
+        failures.append(f'simplify_line of {name} reports {line.max_deviation_m:.3f}m, points are up to {deviation:.3f}m away')
+    if max_vertices is None and deviation > tolerance_m + ATOL:
+        failures.append(f'simplify_line of {name} left a point {deviation:.3f}m away, tolerance {tolerance_m:.3f}m')
+    if max_vertices is not None and len(line.indices) > max(max_vertices, 2):
+        failures.append(f'simplify_line of {name} kept {len(line.indices)} points, budget {max_vertices}')
+    return failures
+
+
+def check_track(gpx_file, name):
+    failures = []
+    expected = gpxpy_points(gpx_file)
+    lat, lon, ele = stream_track_points(gpx_file)
+    if not all(np.array_equal(np.asarray(a, dtype=float), b, equal_nan=True) for a, b in zip(expected, (lat, lon, ele))):
+        failures.append(f'stream_track_points of {name} differs from gpxpy')
+    if len(lat) < 3:
+        return failures
+
+    distances, elevations = parse_gpx(gpx_file)
+    reference = get_total_ascent(pd.DataFrame({'Distance (km)': distances, 'Elevation (m)': elevations}))
+    if round(compute_ascent(distances, elevations)) != round(reference):
+        failures.append(f'compute_ascent of {name} is {compute_ascent(distances, elevations)}, get_total_ascent {reference}')
+
+    for max_points in (2, 50, 500):
+        failures += check_lttb(name, np.asarray(distances), np.asarray(elevations), max_points)
+    for zoom in (12, 15, 18):
+        failures += check_simplify(name, lat, lon, zoom_tolerance(zoom, np.mean(lat)))
+    failures += check_simplify(name, lat, lon, None, max_vertices=100)
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--gpx-dir', default='gpx')
+    parser.add_argument('--lines', type=int, default=200, help='pairs of random lines the distances are checked on')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    failures = check_distances(rng, args.lines)
+    print(f'hausdorff, discrete_frechet: {args.lines} random pairs each')
+
+    for n in (3, 4, 10, 1000):
+        x = np.sort(rng.uniform(0, 10, n))
+        failures += check_lttb(f'{n} random points', x, rng.normal(0, 50, n), 5)
+        east, north = random_line(rng, n).T
+        lat, lon = 53 + north / ONE_DEGREE, -6 + east / (ONE_DEGREE * np.cos(np.radians(53)))
+        failures += check_simplify(f'{n} random points', lat, lon, 5.0)
+
+    gpx_files = sorted(glob.glob(os.path.join(args.gpx_dir, '**', '*.gpx'), recursive=True))
+    for gpx_file in gpx_files:
+        failures += check_track(gpx_file, os.path.relpath(gpx_file, args.gpx_dir))
+    print(f'stream_track_points, compute_ascent, lttb_indices, simplify_line: {len(gpx_files)} gpx files')
+
+    if failures:
+        print('\nNUMERIC CHECKS FAILED\n' + '\n'.join(failures))
+        sys.exit(1)
+    print('\nall checks passed')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+'''Runs the app page on copies of the sheets with measurements that aren't numbers.
+
+An empty or unparseable Distance, Height or Ascent cell must be reported as not
+populated rather than crash the page. Each case blanks, or writes text into,
+one of them on the first walk of the release, in a scratch folder linking
+to the real gpx files and images, and the page is run there with AppTest:
+    python -m benchmarks.check_page [--release Release3]
+'''
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+
+import pandas as pd
+
+from walk_data import WALKS_FILE, POIS_FILE, IMAGES_FILE
+
+APP_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app.py')
+# (column, value written into the sheet, text the page must show)
+CASES = [
+    ('Distance', '', 'Distance is not populated in the data'),
+    ('Distance', '5.5 km', 'Distance is not populated in the data'),
+    ('Height', '', 'Highest point is not populated in the data'),
+    ('Ascent', 'n/a', 'Total ascent not populated in the data'),
+]
+
+
+def run_page(data_dir, release):
+    '''the markdown of the page of the first walk of the release, or the exception it raised'''
+    from streamlit.testing.v1 import AppTest
+
+    cwd = os.getcwd()
+    os.chdir(data_dir)
+    try:
+        at = AppTest.from_file(APP_FILE, default_timeout=300)
+        at.run()
+        phase = next(select for select in at.selectbox if select.label.startswith('Select data capture phase'))
+        if phase.value != release:
+            phase.set_value(release)
+            at.run()
+    finally:
+        os.chdir(cwd)
+    if at.exception:
+        return None, at.exception[0].value
+    return [markdown.value for markdown in at.markdown], None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--release', default='Release3')
+    args = parser.parse_args()
+
+    # the page shouldn't log or warm up in the scratch folder
+    os.environ['VAM_PROFILE_LOG'] = ''
+    os.environ['VAM_WARMUP'] = '0'
+    walks = pd.read_csv(WALKS_FILE, dtype=str)
+    first = walks.index[walks['ToEvolveTech'] == args.release][0]
+    failures = []
+    with tempfile.TemporaryDirectory() as data_dir:
+        for folder in ['gpx', 'images']:
+            os.symlink(os.path.abspath(folder), os.path.join(data_dir, folder))
+        for sheet in [POIS_FILE, IMAGES_FILE]:
+            shutil.copyfile(sheet, os.path.join(data_dir, sheet))
+        for column, value, expected in CASES:
+            case = walks.copy()
+            case.loc[first, column] = value
+            case.to_csv(os.path.join(data_dir, WALKS_FILE), index=False)
+            markdown, exception = run_page(data_dir, args.release)
+            label = f'{column} = {value!r} on {walks.at[first, "Name"]}'
+            if exception is not None:
+                failure = f'the page raised {exception}'
+            elif not any(expected in text for text in markdown):
+                failure = f'the page doesn\'t say "{expected}"'
+            else:
+                failure = None
+            print(f'{label}: {failure or "ok"}')
+            if failure:
+                failures.append(f'{label}: {failure}')
+
+    if failures:
+        print('\nPAGE CHECKS FAILED\n' + '\n'.join(failures))
+        sys.exit(1)
+    print('\nall checks passed')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+'''Synthetic copy of the catalogue at 10x to 100x scale, for benchmarking.
+
+Every walk in WALKS.csv that has a gpx file is copied scale times. Each copy
+gets its own name, and its gpx track is the original shifted by a random
+offset with a few metres of noise on every point, so routes keep the point
+density and shape of real recordings. The copies' POIs are shifted with them.
+Their images point at hard links of the real images, which takes no extra
+space. The output folder has the same layout as the repository, so the app
+and the scripts can be run from inside it:
+    python -m benchmarks.synthetic --scale 10 [--output-dir synthetic_data]
+'''
+import argparse
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from app_fncs import ONE_DEGREE, load_track
+from walk_data import WALKS_FILE, POIS_FILE, IMAGES_FILE
+
+OUTPUT_DIR = 'synthetic_data'
+GPX_DIR = 'gpx'
+IMG_DIR = 'images'
+# copies are moved up to this far from the original, and each point by a few metres
+MAX_OFFSET_M = 20000
+POINT_NOISE_M = 3
+
+GPX_HEADER = ('<?xml version="1.0" encoding="UTF-8"?><gpx version="1.1" creator="benchmarks.synthetic" '
+              'xmlns="http://www.topografix.com/GPX/1/1"><trk><trkseg>')
+GPX_FOOTER = '</trkseg></trk></gpx>\n'
+
+
+def write_gpx(gpx_file, lat, lon, ele):
+    points = ''.join(f'<trkpt lat="{la:.6f}" lon="{lo:.6f}"><ele>{e:.1f}</ele></trkpt>' if not np.isnan(e) else
+                     f'<trkpt lat="{la:.6f}" lon="{lo:.6f}"></trkpt>' for la, lo, e in zip(lat, lon, ele))
+    with open(gpx_file, 'w') as f:
+        f.write(GPX_HEADER + points + GPX_FOOTER)
+
+
+def link_or_copy(src_file, dst_file):
+    if os.path.exists(dst_file):
+        return
+    try:
+        os.link(src_file, dst_file)
+    except OSError:
+        shutil.copyfile(src_file, dst_file)
+
+
+def generate(scale, output_dir=OUTPUT_DIR, gpx_dir='./gpx/', img_dir='./images', seed=0):
+    '''write the scaled sheets, gpx files and images to output_dir. Returns the number of walks'''
+    rng = np.random.default_rng(seed)
+    walks = pd.read_csv(WALKS_FILE, dtype=str)
+    pois = pd.read_csv(POIS_FILE, dtype=str)
+    images = pd.read_csv(IMAGES_FILE, dtype=str)
+    walks = walks[walks['Name'].notna() & walks['GeoJson'].fillna('').map(
+        lambda name: len(name) > 1 and os.path.isfile(os.path.join(gpx_dir, name)))]
+
+    os.makedirs(os.path.join(output_dir, GPX_DIR), exist_ok=True)
+    os.makedirs(os.path.join(output_dir, IMG_DIR), exist_ok=True)
+    new_walks, new_pois, new_images = [], [], []
+    for copy in range(scale):
+        suffix = f'S{copy:03d}'
+        for _, walk in walks.iterrows():
+            track = load_track(os.path.join(gpx_dir, walk['GeoJson']))
+            if track.centre is None:
+                continue
+            coef = np.cos(np.radians(track.centre[0]))
+            d_lat, d_lon = rng.uniform(-MAX_OFFSET_M, MAX_OFFSET_M, 2) / ONE_DEGREE
+            d_lon /= coef
+            noise = rng.normal(0, POINT_NOISE_M / ONE_DEGREE, (2, len(track.lat)))
+            gpx_name = f'{os.path.splitext(walk["GeoJson"])[0]}_{suffix}.gpx'
+            write_gpx(os.path.join(output_dir, GPX_DIR, gpx_name), track.lat + d_lat + noise[0],
+                      track.lon + d_lon + noise[1] / coef, track.ele)
+
+            name = f'{walk["Name"]} {suffix}'
+            row = walk.copy()
+            row['Name'], row['GeoJson'] = name, gpx_name
+            for column, shift in [('StartLocationLat', d_lat), ('StartLocationLng', d_lon),
+                                  ('EndLocationLat', d_lat), ('EndLocationLng', d_lon)]:
+                value = pd.to_numeric(row[column], errors='coerce') + shift
+                row[column] = None if np.isnan(value) else f'{value:.6f}'
+            walk_images = images[images['Name'] == walk['Name']]
+            image_names = {filename: f'{suffix}_{filename}' for filename in walk_images['FILENAME'].dropna()}
+            if isinstance(walk['CoverImageFile'], str):
+                image_names.setdefault(walk['CoverImageFile'], f'{suffix}_{walk["CoverImageFile"]}')
+                row['CoverImageFile'] = image_names[walk['CoverImageFile']]
+            new_walks.append(row)
+
+            walk_pois = pois[pois['WALK_Name'] == walk['Name']].copy()
+            walk_pois['WALK_Name'] = name
+            walk_pois['Latitude'] = pd.to_numeric(walk_pois['Latitude'], errors='coerce') + d_lat
+            walk_pois['Longitude'] = pd.to_numeric(walk_pois['Longitude'], errors='coerce') + d_lon
+            new_pois.append(walk_pois)
+
+            walk_images = walk_images.assign(Name=name, FILENAME=walk_images['FILENAME'].map(image_names))
+            new_images.append(walk_images)
+            for filename, new_filename in image_names.items():
+                src_file = os.path.join(img_dir, filename)
+                if os.path.isfile(src_file):
+                    link_or_copy(src_file, os.path.join(output_dir, IMG_DIR, new_filename))
+
+    pd.DataFrame(new_walks).to_csv(os.path.join(output_dir, WALKS_FILE), index=False)
+    pd.concat(new_pois).to_csv(os.path.join(output_dir, POIS_FILE), index=False)
+    pd.concat(new_images).to_csv(os.path.join(output_dir, IMAGES_FILE), index=False)
+    return len(new_walks)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', type=int, default=10, help='copies of every walk, 10 to 100 for a realistic future catalogue')
+    parser.add_argument('--output-dir', default=OUTPUT_DIR)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    n_walks = generate(args.scale, args.output_dir, seed=args.seed)
+    print(f'{n_walks} walks written to {args.output_dir}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+'''Manifest of the images folder, and an audit of it against the sheets.
+
+The manifest holds the size, mtime, pixel dimensions and sha1 of every file in
+images/, from a single directory scan. It is saved to MANIFEST_FILE and only
+files whose size or mtime changed are re-read, so after the first run a scan
+is one os.scandir call. Within the app the manifest is kept until the folder's
+mtime changes (a file added, removed or renamed), so rendering a walk never
+touches the files themselves. An image overwritten in place leaves the folder's
+mtime as it was, so the manifest is also rescanned once it is MANIFEST_MAX_AGE_S
+old, or straight away with the app's "Rescan images" button.
+
+audit_images checks the manifest against IMAGES.csv and CoverImageFile in
+WALKS.csv in one go, reporting missing, orphaned, oversized and duplicate
+images for every walk:
+    python image_manifest.py [--output image_audit.csv]
+'''
+import argparse
+import json
+import os
+import threading
+import time
+
+import pandas as pd
+from PIL import Image
+
+from track_store import file_hash
+from walk_data import WALKS_FILE, IMAGES_FILE, read_walks, read_images
+
+IMG_DIR = './images'
+MANIFEST_FILE = 'image_manifest.json'
+MANIFEST_COLUMNS = ['size', 'mtime_ns', 'width', 'height', 'sha1']
+# the app only shows images a few hundred pixels wide, anything above these is worth shrinking
+MAX_IMAGE_BYTES = 1024 * 1024
+MAX_IMAGE_SIDE = 3000
+# longest an image overwritten in place can go unnoticed by the app
+MANIFEST_MAX_AGE_S = 300
+
+MISSING = 'missing'
+ORPHANED = 'orphaned'
+OVERSIZED = 'oversized'
+DUPLICATE = 'duplicate'
+
+
+def image_size(img_file):
+    '''(width, height) from the image header, (None, None) if it isn't an image'''
+    try:
+        with Image.open(img_file) as img:
+            return img.size
+    except (OSError, ValueError):
+        return None, None
+
+
+def scan_images(img_dir=IMG_DIR, previous=None):
+    '''manifest entry of every file in img_dir, re-reading only files whose size or mtime changed'''
+    previous = previous or {}
+    entries = {}
+    with os.scandir(img_dir) as scan:
+        for entry in scan:
+            if not entry.is_file():
+                continue
+            stat = entry.stat()
+            old = previous.get(entry.name)
+            if old and old['size'] == stat.st_size and old['mtime_ns'] == stat.st_mtime_ns:
+                entries[entry.name] = old
+                continue
+            width, height = image_size(entry.path)
+            entries[entry.name] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                                   'width': width, 'height': height, 'sha1': file_hash(entry.path)}
+    return entries
+
+
+def update_manifest(img_dir=IMG_DIR, manifest_file=MANIFEST_FILE):
+    '''scan img_dir against the saved manifest, saving it again if anything changed.
+    Returns the manifest as a frame indexed by file name'''
+    try:
+        with open(manifest_file) as f:
+            previous = json.load(f)
+    except FileNotFoundError:
+        previous = {}
+
+    entries = scan_images(img_dir, previous)
+    if entries != previous:
+        tmp_file = f'{manifest_file}.{os.getpid()}.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump(entries, f, indent=1)
+        os.replace(tmp_file, manifest_file)
+
+    manifest = pd.DataFrame.from_dict(entries, orient='index', columns=MANIFEST_COLUMNS)
+    manifest.index.name = 'FILENAME'
+    return manifest.astype({'width': 'Int64', 'height': 'Int64'})
+
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def load_manifest(img_dir=IMG_DIR, manifest_file=MANIFEST_FILE, max_age_s=MANIFEST_MAX_AGE_S, rescan=False):
+    '''the manifest, only rescanned when the folder's mtime changes, it is older than
+    max_age_s or rescan is set'''
+    key = os.stat(img_dir).st_mtime_ns
+    with _cache_lock:
+        cached = _cache.get(img_dir)
+        if rescan or cached is None or cached[0] != key or time.monotonic() - cached[1] > max_age_s:
+            cached = (key, time.monotonic(), update_manifest(img_dir, manifest_file))
+            _cache[img_dir] = cached
+        return cached[2]
+
+
+def image_references(walks, images):
+    '''every image the sheets refer to: Name, FILENAME and the column it came from'''
+    gallery = images[['Name', 'FILENAME']].assign(referenced_by='IMAGES.csv')
+    covers = walks[['Name', 'CoverImageFile']].rename(columns={'CoverImageFile': 'FILENAME'})
+    references = pd.concat([gallery, covers.assign(referenced_by='CoverImageFile')], ignore_index=True)
+    references['FILENAME'] = references['FILENAME'].str.strip()
+    return references[references['FILENAME'].fillna('') != ''].reset_index(drop=True)
+
+
+def audit_images(manifest, walks, images, max_bytes=MAX_IMAGE_BYTES, max_side=MAX_IMAGE_SIDE):
+    '''one row per problem found: issue, FILENAME, Name (the walks using it), referenced_by and detail'''
+    references = image_references(walks, images)
+    used_by = references.groupby('FILENAME')['Name'].agg(lambda names: ', '.join(names.dropna().unique()))
+
+    missing = references[~references['FILENAME'].isin(manifest.index)].assign(
+        issue=MISSING, detail='no such file in the images folder')
+
+    orphaned = manifest.index[~manifest.index.isin(references['FILENAME'])]
+    orphaned = pd.DataFrame({'FILENAME': orphaned, 'issue': ORPHANED,
+                             'detail': 'not in IMAGES.csv or CoverImageFile'})
+
+    side = manifest[['width', 'height']].max(axis=1)
+    too_big = manifest[(manifest['size'] > max_bytes) | (side > max_side).fillna(False)]
+    oversized = pd.DataFrame({
+        'FILENAME': too_big.index, 'issue': OVERSIZED,
+        'detail': [f'{size / 1024 / 1024:.1f}MB, {width}x{height}px'
+                   for size, width, height in zip(too_big['size'], too_big['width'], too_big['height'])]})
+
+    copies = manifest[manifest.duplicated('sha1', keep=False)]
+    same_as = copies.reset_index().groupby('sha1')['FILENAME'].agg(list)
+    duplicate = pd.DataFrame({
+        'FILENAME': copies.index, 'issue': DUPLICATE,
+        'detail': ['same content as ' + ', '.join(f for f in same_as[sha1] if f != filename)
+                   for filename, sha1 in zip(copies.index, copies['sha1'])]})
+
+    found = pd.concat([oversized, duplicate], ignore_index=True)
+    found['Name'] = found['FILENAME'].map(used_by)
+    report = pd.concat([missing, orphaned, found], ignore_index=True)
+    return report.reindex(columns=['issue', 'FILENAME', 'Name', 'referenced_by', 'detail'])
+
+
+_audit_cache = {}
+
+
+def load_audit(manifest, walks, images, walks_file=WALKS_FILE, images_file=IMAGES_FILE):
+    '''audit_images of the sheets read from walks_file and images_file, recomputed only when
+    load_manifest gives a new manifest or either sheet changes'''
+    key = (os.stat(walks_file).st_mtime_ns, os.stat(images_file).st_mtime_ns)
+    with _cache_lock:
+        cached = _audit_cache.get((walks_file, images_file))
+        # the manifest is compared by identity, load_manifest returns the same frame until it rescans
+        if cached is None or cached[0] is not manifest or cached[1] != key:
+            cached = (manifest, key, audit_images(manifest, walks, images))
+            _audit_cache[(walks_file, images_file)] = cached
+        return cached[2]
+
+
+def walks_issues(report, names):
+    '''the rows of an audit that concern any of the walks in names, plus the orphaned files'''
+    names = set(names)
+    concerned = report['Name'].fillna('').str.split(', ').map(lambda walk_names: not names.isdisjoint(walk_names))
+    return report[concerned | (report['issue'] == ORPHANED)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--img-dir', default=IMG_DIR)
+    parser.add_argument('--walks', default=WALKS_FILE)
+    parser.add_argument('--images', default=IMAGES_FILE)
+    parser.add_argument('--output', help='write the audit to this csv')
+    args = parser.parse_args()
+
+    manifest = update_manifest(args.img_dir)
+    report = audit_images(manifest, read_walks(args.walks), read_images(args.images))
+    if args.output:
+        report.to_csv(args.output, index=False)
+    print(f"{len(manifest)} files, {manifest['size'].sum() / 1024 / 1024:.1f}MB in {args.img_dir}")
+    print(report['issue'].value_counts().to_string())
+    with pd.option_context('display.max_rows', None, 'display.max_colwidth', 60, 'display.width', 200):
+        print(report.to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
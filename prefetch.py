@@ -0,0 +1,88 @@
+'''Background warming of the caches for the walks a reviewer is likely to open next.
+
+After a walk renders, the app asks for the previous and next walks in the list
+to be prefetched: parsed track, summary (distance, highest point, ascent),
+simplified route line and the first page of thumbnails. All sessions share a
+single worker thread and a small bound on queued walks, so prefetching never
+competes with more than one foreground render, and a new selection cancels
+whatever the session had queued before.
+'''
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from app_fncs import load_track, load_track_summary, load_simplified_track
+from thumbnails import make_thumbnail
+from walk_data import walk_images
+
+MAX_WORKERS = 1
+# walks waiting for the worker, across all sessions, beyond which new requests are dropped
+MAX_PENDING = 4
+
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix='prefetch')
+_pending = threading.BoundedSemaphore(MAX_PENDING)
+
+
+class PrefetchJob:
+    '''the walks queued by one request, cancelled as a whole'''
+    def __init__(self):
+        self.cancelled = threading.Event()
+        self.futures = []
+
+    def cancel(self):
+        self.cancelled.set()
+        for future in self.futures:
+            future.cancel()
+
+    def done(self):
+        return all(future.done() for future in self.futures)
+
+
+def adjacent(names, name):
+    '''the walks before and after name in the list, next one first'''
+    if name not in names:
+        return []
+    i = names.index(name)
+    return [names[j] for j in (i + 1, i - 1) if 0 <= j < len(names) and names[j] != name]
+
+
+def warm_walk(walk, images, gpx_dir, img_dir, page_size, cancelled=None):
+    '''load everything the page needs for a walk into the caches, stopping early if cancelled'''
+    cancelled = cancelled or threading.Event()
+    gpx_file = os.path.join(gpx_dir, str(walk.GeoJson))
+    if len(str(walk.GeoJson)) > 1 and os.path.isfile(gpx_file):
+        for step in (load_track, load_track_summary, load_simplified_track):
+            if cancelled.is_set():
+                return
+            step(gpx_file)
+    for filename in images['FILENAME'].iloc[:page_size]:
+        img_file = os.path.join(img_dir, filename)
+        if cancelled.is_set():
+            return
+        if os.path.isfile(img_file):
+            try:
+                make_thumbnail(img_file)
+            except (OSError, ValueError):
+                pass
+
+
+def _run(job, *args):
+    try:
+        if not job.cancelled.is_set():
+            warm_walk(*args, cancelled=job.cancelled)
+    finally:
+        _pending.release()
+
+
+def prefetch(walks, data, gpx_dir, img_dir, page_size):
+    '''queue the given walks for warming. Returns a PrefetchJob to cancel them with'''
+    job = PrefetchJob()
+    for name in walks:
+        if not _pending.acquire(blocking=False):
+            break
+        job.futures.append(_executor.submit(_run, job, data.walk_records[name], walk_images(data, name),
+                                            gpx_dir, img_dir, page_size))
+    # a future cancelled before it started never runs _run, so give its slot back here
+    for future in job.futures:
+        future.add_done_callback(lambda f: _pending.release() if f.cancelled() else None)
+    return job
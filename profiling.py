@@ -0,0 +1,114 @@
+'''Per stage timing, and optional memory tracing, of a rerun of the app.
+
+Wrap each stage of the page in profile.stage(name). At the end of the rerun
+the stages are appended as one json line to PROFILE_LOG, and can be shown in
+the sidebar debug panel.
+
+tracemalloc is process wide, so with several reviewers connected the memory
+figures of a stage include whatever the other sessions allocated meanwhile.
+Tracing runs while any rerun asks for it and is only stopped once the last of
+them has closed its profiler, so a session that doesn't trace never turns it
+off under one that does. A stage whose figures can't be trusted, because
+tracing wasn't on for all of it or another traced stage reset the peak
+meanwhile, has memory_reliable set to False (and no figures if tracing was off).
+'''
+import json
+import os
+import threading
+import time
+import tracemalloc
+import weakref
+from contextlib import contextmanager
+
+import pandas as pd
+
+# json lines log of every rerun, set VAM_PROFILE_LOG to an empty string to turn it off
+PROFILE_LOG = os.environ.get('VAM_PROFILE_LOG', 'profile_log.jsonl')
+
+_log_lock = threading.Lock()
+_tracing_lock = threading.Lock()
+# reruns tracing memory right now, and whether the tracing running now was started here:
+# tracing started by something else (such as the benchmark suite) is left alone
+_tracing_users = 0
+_tracing_started = False
+# bumped each time tracing is started here and each time a stage resets the peak, so a
+# stage can tell if either happened while it ran
+_tracing_generation = 0
+_peak_resets = 0
+
+
+def _acquire_tracing():
+    global _tracing_users, _tracing_started, _tracing_generation
+    with _tracing_lock:
+        _tracing_users += 1
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _tracing_started = True
+            _tracing_generation += 1
+
+
+def _release_tracing():
+    global _tracing_users, _tracing_started
+    with _tracing_lock:
+        _tracing_users -= 1
+        if _tracing_users == 0 and _tracing_started:
+            tracemalloc.stop()
+            _tracing_started = False
+
+
+class Profiler:
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.stages = []
+        self._start = time.perf_counter()
+        if trace_memory:
+            _acquire_tracing()
+            # released by close() at the end of the rerun, or once the profiler is
+            # dropped if the rerun stopped early
+            self._release = weakref.finalize(self, _release_tracing)
+
+    def close(self):
+        '''stop asking for memory tracing, once the last stage of the rerun has run'''
+        if self.trace_memory:
+            self._release()
+
+    @contextmanager
+    def stage(self, name):
+        '''time the code in the with block, and the memory it allocated if tracing'''
+        global _peak_resets
+        if self.trace_memory:
+            with _tracing_lock:
+                tracing, generation = tracemalloc.is_tracing(), _tracing_generation
+                tracemalloc.reset_peak()
+                _peak_resets += 1
+                resets = _peak_resets
+                before = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            record = {'stage': name, 'ms': round((time.perf_counter() - start) * 1000, 2)}
+            if self.trace_memory:
+                with _tracing_lock:
+                    traced = tracing and tracemalloc.is_tracing() and generation == _tracing_generation
+                    current, peak = tracemalloc.get_traced_memory()
+                    record['allocated_kb'] = round((current - before) / 1024, 1) if traced else None
+                    record['peak_kb'] = round((peak - before) / 1024, 1) if traced else None
+                    record['memory_reliable'] = traced and resets == _peak_resets
+            self.stages.append(record)
+
+    @property
+    def total_ms(self):
+        return round((time.perf_counter() - self._start) * 1000, 2)
+
+    def frame(self):
+        return pd.DataFrame(self.stages)
+
+    def write_log(self, log_file=PROFILE_LOG, **context):
+        '''append the rerun as one json line, with any extra context such as the selected walk'''
+        if not log_file:
+            return
+        line = json.dumps({'time': time.time(), 'pid': os.getpid(), 'total_ms': self.total_ms,
+                           'stages': self.stages, **context}, default=str)
+        with _log_lock, open(log_file, 'a') as f:
+            f.write(line + '\n')
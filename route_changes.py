@@ -0,0 +1,179 @@
+'''Change report between revised gpx files and the originals they replace.
+
+Each file in a drop of revised tracks (by default gpx/update_from_aaron_16102024)
+is matched to the original in gpx/ with the same name or, failing that, to the
+original it lies closest to. The pair is then compared by the Hausdorff and
+discrete Frechet distances between their points, and by the change in length,
+highest point and ascent. The report is ranked with the biggest change first:
+    python route_changes.py [gpx/update_from_aaron_16102024] [--output route_changes.csv]
+
+Both distances work on the points projected to metres around the route, the
+Hausdorff one in blocks of a pairwise distance matrix and the Frechet one a
+diagonal of its coupling table at a time, so a pair takes milliseconds.
+'''
+import argparse
+import glob
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from app_fncs import ONE_DEGREE, load_track, load_track_summary
+from walk_data import WALKS_FILE, read_walks
+
+UPDATE_DIR = 'gpx/update_from_aaron_16102024'
+GPX_DIR = 'gpx'
+# rows of the pairwise distance matrix computed at a time, bounding its memory
+HAUSDORFF_BLOCK = 1024
+
+
+def to_metres(lat, lon, origin):
+    '''points as an (n, 2) array of metres east and north of origin (lat, lon)'''
+    coef = np.cos(np.radians(origin[0]))
+    return np.column_stack(((lon - origin[1]) * coef * ONE_DEGREE, (lat - origin[0]) * ONE_DEGREE))
+
+
+def hausdorff(p, q, block=HAUSDORFF_BLOCK):
+    '''largest distance from a point of either line to the nearest point of the other'''
+    # squared distances, so there is a single square root at the end
+    p_to_q = np.empty(len(p))
+    q_to_p = np.full(len(q), np.inf)
+    for start in range(0, len(p), block):
+        dx = p[start:start + block, None, 0] - q[None, :, 0]
+        dy = p[start:start + block, None, 1] - q[None, :, 1]
+        d2 = dx * dx
+        d2 += dy * dy
+        p_to_q[start:start + block] = d2.min(axis=1)
+        np.minimum(q_to_p, d2.min(axis=0), out=q_to_p)
+    return float(np.sqrt(max(p_to_q.max(), q_to_p.max())))
+
+
+def discrete_frechet(p, q):
+    '''discrete Frechet distance between two lines, in the order their points are walked.
+
+    The coupling table ca[i, j] = max(d(p_i, q_j), min(ca[i-1, j], ca[i, j-1], ca[i-1, j-1]))
+    is filled one anti-diagonal (i + j = k) at a time, every cell of which only needs
+    the two diagonals before it, so each step is a handful of array operations on views.'''
+    n, m = len(p), len(q)
+    # three rotating diagonals indexed by i + 1, so index 0 stands for i = -1. Cells just
+    # outside a diagonal are kept at inf, which is all the next two diagonals read
+    diagonals = [np.full(n + 2, np.inf) for _ in range(3)]
+    q_reversed = q[::-1]
+    for k in range(n + m - 1):
+        lo, hi = max(0, k - m + 1), min(k, n - 1)
+        cur, prev1, prev2 = diagonals[k % 3], diagonals[(k - 1) % 3], diagonals[(k - 2) % 3]
+        # j = k - i runs down from k - lo to k - hi, which is a forward slice of q reversed
+        qj = q_reversed[m - 1 - k + lo:m - k + hi]
+        d = np.hypot(p[lo:hi + 1, 0] - qj[:, 0], p[lo:hi + 1, 1] - qj[:, 1])
+        if k == 0:
+            cur[1] = d[0]
+        else:
+            # ca[i, j-1] and ca[i-1, j] are on the previous diagonal, ca[i-1, j-1] the one before
+            best = np.minimum(prev1[lo + 1:hi + 2], prev1[lo:hi + 1])
+            np.minimum(best, prev2[lo:hi + 1], out=best)
+            np.maximum(d, best, out=cur[lo + 1:hi + 2])
+        cur[lo] = cur[hi + 2] = np.inf
+    return float(diagonals[(n + m - 2) % 3][n])
+
+
+def compare_tracks(old_file, new_file):
+    '''shape and summary differences of a revised track against the original'''
+    start = time.perf_counter()
+    old, new = load_track(old_file), load_track(new_file)
+    # a track without points has no centre, the other one's will do to project both
+    origin = old.centre or new.centre or [0.0, 0.0]
+    p = to_metres(old.lat, old.lon, origin)
+    q = to_metres(new.lat, new.lon, origin)
+    if len(p) == 0 or len(q) == 0:
+        shape_change, frechet, reversed_ = np.nan, np.nan, False
+    elif p.shape == q.shape and np.array_equal(p, q):
+        shape_change, frechet, reversed_ = 0.0, 0.0, False
+    else:
+        shape_change = hausdorff(p, q)
+        frechet = discrete_frechet(p, q)
+        reversed_ = False
+        # a track recorded the other way round keeps its shape (Hausdorff) but has a large
+        # Frechet distance, only then is it worth walking the revised track backwards
+        if frechet > 2 * shape_change:
+            frechet_reversed = discrete_frechet(p, q[::-1])
+            reversed_ = frechet_reversed < frechet
+            frechet = min(frechet, frechet_reversed)
+    old_summary, new_summary = load_track_summary(old_file), load_track_summary(new_file)
+    return {
+        'old_points': len(p),
+        'new_points': len(q),
+        'hausdorff_m': shape_change,
+        'frechet_m': frechet,
+        'reversed': reversed_,
+        'distance_km_delta': new_summary.distance_km - old_summary.distance_km,
+        'max_elevation_m_delta': new_summary.max_elevation_m - old_summary.max_elevation_m,
+        'ascent_m_delta': new_summary.ascent_m - old_summary.ascent_m,
+        'compare_ms': (time.perf_counter() - start) * 1000,
+    }
+
+
+def _bounds_overlap(a, b):
+    return a[0][0] <= b[1][0] and b[0][0] <= a[1][0] and a[0][1] <= b[1][1] and b[0][1] <= a[1][1]
+
+
+def match_tracks(new_files, old_files):
+    '''(new file, original, how it was matched) for each revised file. Files without an
+    original of the same name get the original with the nearest points among those
+    whose bounds overlap theirs, or None'''
+    by_name = {os.path.basename(f): f for f in old_files}
+    for new_file in new_files:
+        old_file = by_name.get(os.path.basename(new_file))
+        if old_file is not None:
+            yield new_file, old_file, 'name'
+            continue
+        new = load_track(new_file)
+        if new.bounds is None:
+            yield new_file, None, None
+            continue
+        q = to_metres(new.lat, new.lon, new.centre)
+        candidates = [(hausdorff(to_metres(load_track(f).lat, load_track(f).lon, new.centre), q), f)
+                      for f in old_files if load_track(f).bounds is not None and _bounds_overlap(load_track(f).bounds, new.bounds)]
+        yield (new_file, min(candidates)[1], 'nearest') if candidates else (new_file, None, None)
+
+
+def change_report(update_dir=UPDATE_DIR, gpx_dir=GPX_DIR, walks_file=WALKS_FILE):
+    '''one row per revised file, the biggest change first'''
+    new_files = sorted(glob.glob(os.path.join(update_dir, '*.gpx')))
+    update_dir = os.path.abspath(update_dir)
+    old_files = [f for f in sorted(glob.glob(os.path.join(gpx_dir, '**', '*.gpx'), recursive=True))
+                 if os.path.dirname(os.path.abspath(f)) != update_dir]
+    walks = read_walks(walks_file)
+    walks_using = walks.groupby('GeoJson')['Name'].agg(', '.join)
+
+    rows = []
+    for new_file, old_file, matched_by in match_tracks(new_files, old_files):
+        row = {'new_file': os.path.relpath(new_file, gpx_dir), 'old_file': None, 'matched_by': matched_by,
+               'walks': walks_using.get(os.path.basename(new_file), '')}
+        if old_file is not None:
+            row['old_file'] = os.path.relpath(old_file, gpx_dir)
+            row.update(compare_tracks(old_file, new_file))
+        rows.append(row)
+    report = pd.DataFrame(rows)
+    if 'hausdorff_m' in report:
+        report = report.sort_values(['hausdorff_m', 'frechet_m'], ascending=False, na_position='first')
+    return report.reset_index(drop=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('update_dir', nargs='?', default=UPDATE_DIR)
+    parser.add_argument('--gpx-dir', default=GPX_DIR)
+    parser.add_argument('--walks', default=WALKS_FILE)
+    parser.add_argument('--output', help='write the report to this csv')
+    args = parser.parse_args()
+
+    report = change_report(args.update_dir, args.gpx_dir, args.walks)
+    if args.output:
+        report.to_csv(args.output, index=False)
+    with pd.option_context('display.max_rows', None, 'display.width', 250, 'display.float_format', '{:.4g}'.format):
+        print(report.to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
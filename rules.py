@@ -0,0 +1,112 @@
+'''Declarative validation rules for WALKS.csv.
+
+Each rule is declared once in RULES and evaluated column-wise over the whole
+walks frame, giving a walk by rule matrix of pass (True) / fail (False). The
+matrix is cached until WALKS.csv or the contents of the gpx or images
+folders change.
+'''
+import os
+import threading
+from typing import Callable, NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from app_fncs import ONE_DEGREE
+from walk_data import WALKS_FILE, read_walks
+
+GPX_DIR = './gpx/'
+IMG_DIR = './images'
+# recorded start and end of a loop may be this far apart
+LOOP_MAX_GAP_M = 50
+
+
+class Rule(NamedTuple):
+    name: str
+    description: str
+    check: Callable  # (walks frame, context dict) -> boolean Series, True where the walk passes
+
+
+def required(column):
+    return Rule(f'{column}_populated', f'{column} is populated',
+                lambda walks, context: walks[column].notna() & (walks[column].astype(str).str.strip() != ''))
+
+
+def in_range(column, low, high, unit=''):
+    return Rule(f'{column}_in_range', f'{column} is between {low}{unit} and {high}{unit}',
+                lambda walks, context: walks[column].between(low, high).fillna(False).astype(bool))
+
+
+def file_exists(name, column, folder):
+    return Rule(name, f'{column} is a file in {folder}',
+                lambda walks, context: walks[column].isin(context['files'][folder]))
+
+
+def _loop_closes(walks, context):
+    coef = np.cos(np.radians(walks['StartLocationLat']))
+    gap_m = np.hypot(walks['StartLocationLat'] - walks['EndLocationLat'],
+                     (walks['StartLocationLng'] - walks['EndLocationLng']) * coef) * ONE_DEGREE
+    return (walks['ShapeName'] != 'Loop') | (gap_m <= LOOP_MAX_GAP_M)
+
+
+RULES = [
+    required('Name'),
+    required('ShortDescription'),
+    required('GeneralDescription'),
+    required('ShapeName'),
+    required('Duration'),
+    required('Grading'),
+    required('ToEvolveTech'),
+    required('StartLocationLat'),
+    required('StartLocationLng'),
+    required('EndLocationLat'),
+    required('EndLocationLng'),
+    required('GeoJson'),
+    required('CoverImageFile'),
+    in_range('Distance', 100, 100000, 'm'),
+    # Lugnaquilla, the highest point in Wicklow, is 925m
+    in_range('Height', 1, 1000, 'm'),
+    in_range('Ascent', 1, 5000, 'm'),
+    Rule('loop_start_is_end', f'start and end of a Loop are within {LOOP_MAX_GAP_M}m', _loop_closes),
+    file_exists('gpx_file_exists', 'GeoJson', GPX_DIR),
+    file_exists('cover_image_exists', 'CoverImageFile', IMG_DIR),
+]
+
+
+def list_files(folder):
+    '''names of the files in a folder, from a single directory scan'''
+    with os.scandir(folder) as entries:
+        return {entry.name for entry in entries if entry.is_file()}
+
+
+def evaluate_rules(walks, rules=RULES, gpx_dir=GPX_DIR, img_dir=IMG_DIR):
+    '''walk by rule matrix, indexed by walk name with a boolean column per rule'''
+    folders = {GPX_DIR: gpx_dir, IMG_DIR: img_dir}
+    context = {'files': {key: list_files(folder) for key, folder in folders.items()}}
+    matrix = pd.DataFrame({rule.name: rule.check(walks, context).to_numpy(dtype=bool) for rule in rules},
+                          index=walks['Name'])
+    matrix.columns.name = 'rule'
+    return matrix
+
+
+def failed_rules(matrix, name, rules=RULES):
+    '''descriptions of the rules a walk fails'''
+    descriptions = {rule.name: rule.description for rule in rules}
+    row = matrix.loc[name]
+    return [descriptions[rule] for rule in row.index[~row.to_numpy()]]
+
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def rule_matrix(walks_file=WALKS_FILE, gpx_dir=GPX_DIR, img_dir=IMG_DIR):
+    '''the matrix for WALKS.csv, recomputed only when the sheet or the folder contents change'''
+    # adding, removing or renaming a file changes the mtime of its folder
+    key = tuple(os.stat(path).st_mtime_ns for path in (walks_file, gpx_dir, img_dir))
+    with _cache_lock:
+        cached = _cache.get((walks_file, gpx_dir, img_dir))
+        if cached is None or cached[0] != key:
+            cached = (key, evaluate_rules(read_walks(walks_file), RULES, gpx_dir, img_dir))
+            _cache[(walks_file, gpx_dir, img_dir)] = cached
+        return cached[1]
@@ -0,0 +1,223 @@
+'''Versioned snapshots of WALKS.csv and incremental revalidation.
+
+Every old_data/vN/WALKS.csv, plus the live WALKS.csv as version "current", is
+ingested into a parquet file in SNAPSHOT_STORE (only re-ingested when the csv
+changes). Any two versions can then be diffed row by row:
+    python snapshots.py diff v11 current
+
+Revalidation only re-runs the gpx checks for walks whose sheet values or gpx
+file changed since the last validated version, and merges them into the
+previous results:
+    python snapshots.py revalidate [--version current]
+'''
+import argparse
+import glob
+import json
+import os
+import re
+
+import pandas as pd
+
+from track_store import file_hash
+from validation import validate_walks, write_report
+
+SNAPSHOT_DIR = 'old_data'
+SNAPSHOT_STORE = 'snapshot_store'
+CURRENT = 'current'
+CURRENT_WALKS_FILE = 'WALKS.csv'
+VALIDATION_STATE_FILE = os.path.join(SNAPSHOT_STORE, 'validation_state.json')
+# sheet columns that feed the gpx checks, a change to any other column doesn't need revalidating
+VALIDATED_FIELDS = ['GeoJson', 'Distance', 'Height', 'Ascent', 'ToEvolveTech']
+
+
+def snapshot_files(snapshot_dir=SNAPSHOT_DIR):
+    '''version name -> WALKS.csv of that version, oldest first, ending with the live sheet'''
+    files = {os.path.basename(os.path.dirname(f)): f for f in glob.glob(os.path.join(snapshot_dir, 'v*', 'WALKS.csv'))}
+    versions = sorted(files, key=lambda version: int(re.sub(r'\D', '', version) or 0))
+    ordered = {version: files[version] for version in versions}
+    ordered[CURRENT] = CURRENT_WALKS_FILE
+    return ordered
+
+
+def read_snapshot_csv(walks_file):
+    '''a WALKS.csv of any version, as text indexed by walk name. The old sheets mix
+    numbers and text in the same columns, so nothing is converted here'''
+    walks = pd.read_csv(walks_file, dtype=str)
+    walks.columns = [column.strip() for column in walks.columns]
+    walks = walks.dropna(subset=['Name'])
+    walks['Name'] = walks['Name'].str.strip()
+    walks = walks.drop_duplicates(subset='Name').set_index('Name')
+    return walks.apply(lambda column: column.str.strip())
+
+
+def _manifest_file(store_dir):
+    return os.path.join(store_dir, 'manifest.json')
+
+
+def ingest_snapshots(snapshot_dir=SNAPSHOT_DIR, store_dir=SNAPSHOT_STORE):
+    '''write a parquet file per version, skipping versions whose csv is unchanged. Returns the versions written'''
+    os.makedirs(store_dir, exist_ok=True)
+    try:
+        with open(_manifest_file(store_dir)) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        manifest = {}
+
+    written = []
+    for version, walks_file in snapshot_files(snapshot_dir).items():
+        mtime_ns = os.stat(walks_file).st_mtime_ns
+        parquet_file = os.path.join(store_dir, f'walks_{version}.parquet')
+        if manifest.get(version) == mtime_ns and os.path.isfile(parquet_file):
+            continue
+        read_snapshot_csv(walks_file).to_parquet(parquet_file)
+        manifest[version] = mtime_ns
+        written.append(version)
+
+    if written:
+        with open(_manifest_file(store_dir), 'w') as f:
+            json.dump(manifest, f, indent=1)
+    return written
+
+
+def load_snapshot(version, snapshot_dir=SNAPSHOT_DIR, store_dir=SNAPSHOT_STORE):
+    ingest_snapshots(snapshot_dir, store_dir)
+    return pd.read_parquet(os.path.join(store_dir, f'walks_{version}.parquet'))
+
+
+def diff_snapshots(old, new, fields=None):
+    '''row level differences between two snapshots, one row per changed field.
+
+    Returns a frame with columns Name, change ('added', 'removed' or 'changed'),
+    field, old and new. Added and removed walks get a single row with no field.
+    The comparison runs over the whole aligned frames at once.'''
+    columns = [c for c in old.columns.union(new.columns, sort=False) if fields is None or c in fields]
+    old = old.reindex(columns=columns)
+    new = new.reindex(columns=columns)
+
+    added = new.index.difference(old.index)
+    removed = old.index.difference(new.index)
+    common = old.index.intersection(new.index)
+
+    a, b = old.loc[common], new.loc[common]
+    changed = (a != b) & ~(a.isna() & b.isna())
+    changed_cells = changed.stack()
+    changed_cells = changed_cells[changed_cells].index
+    rows = pd.DataFrame({
+        'Name': changed_cells.get_level_values(0),
+        'change': 'changed',
+        'field': changed_cells.get_level_values(1),
+        'old': [a.at[name, field] for name, field in changed_cells],
+        'new': [b.at[name, field] for name, field in changed_cells],
+    })
+    rows = pd.concat([
+        pd.DataFrame({'Name': added, 'change': 'added'}),
+        pd.DataFrame({'Name': removed, 'change': 'removed'}),
+        rows,
+    ], ignore_index=True)
+    return rows.reindex(columns=['Name', 'change', 'field', 'old', 'new'])
+
+
+def summarise_diff(diff):
+    '''one row per walk listing the fields that changed'''
+    return diff.groupby(['Name', 'change'], sort=False)['field'].apply(
+        lambda fields: ', '.join(fields.dropna())).reset_index()
+
+
+def validation_input(snapshot):
+    '''the columns validate_walk needs, with the numbers parsed. Text such as "5.5 km"
+    becomes empty and is reported as not populated'''
+    walks = snapshot.reindex(columns=VALIDATED_FIELDS).reset_index()
+    for column in ['Distance', 'Height', 'Ascent']:
+        walks[column] = pd.to_numeric(walks[column], errors='coerce')
+    return walks
+
+
+def _gpx_hashes(walks, gpx_dir, previous):
+    '''sha1 of each walk's gpx file, only re-hashing files whose mtime changed'''
+    hashes = {}
+    for gpx_name in walks['GeoJson'].dropna().unique():
+        gpx_file = os.path.join(gpx_dir, gpx_name)
+        if not os.path.isfile(gpx_file):
+            continue
+        mtime_ns = os.stat(gpx_file).st_mtime_ns
+        old = previous.get(gpx_name)
+        hashes[gpx_name] = old if old and old['mtime_ns'] == mtime_ns else {'mtime_ns': mtime_ns, 'sha1': file_hash(gpx_file)}
+    return hashes
+
+
+def revalidate(version=CURRENT, gpx_dir='./gpx/', state_file=VALIDATION_STATE_FILE, max_workers=None):
+    '''validation report for a version, only re-checking walks that changed since the last run.
+
+    Returns the full report and the names of the walks that were re-checked.'''
+    try:
+        with open(state_file) as f:
+            state = json.load(f)
+    except FileNotFoundError:
+        state = {'version': None, 'gpx': {}, 'results': []}
+
+    snapshot = load_snapshot(version)
+    walks = validation_input(snapshot)
+    hashes = _gpx_hashes(walks, gpx_dir, state['gpx'])
+    previous = pd.DataFrame(state['results'])
+
+    if state['version'] is None or previous.empty:
+        recheck = set(walks['Name'])
+    else:
+        diff = diff_snapshots(load_snapshot(state['version']), snapshot, fields=VALIDATED_FIELDS)
+        recheck = set(diff.loc[diff['change'] != 'removed', 'Name'])
+        changed_gpx = {gpx_name for gpx_name, entry in hashes.items()
+                       if state['gpx'].get(gpx_name, {}).get('sha1') != entry['sha1']}
+        recheck |= set(walks.loc[walks['GeoJson'].isin(changed_gpx), 'Name'])
+        # walks that were never validated, e.g. after a failed run
+        recheck |= set(walks['Name']) - set(previous['Name'])
+        # and walks whose gpx file couldn't be read last time
+        if 'error' in previous:
+            recheck |= set(previous.loc[previous['error'].notna(), 'Name'])
+
+    rechecked = validate_walks(walks[walks['Name'].isin(recheck)], gpx_dir, max_workers)
+    if not previous.empty:
+        kept = previous[previous['Name'].isin(walks['Name']) & ~previous['Name'].isin(recheck)]
+        report = pd.concat([kept, rechecked], ignore_index=True)
+    else:
+        report = rechecked
+    order = {name: i for i, name in enumerate(walks['Name'])}
+    report = report.sort_values('Name', key=lambda names: names.map(order)).reset_index(drop=True)
+
+    os.makedirs(os.path.dirname(state_file), exist_ok=True)
+    with open(state_file, 'w') as f:
+        json.dump({'version': version, 'gpx': hashes,
+                   'results': json.loads(report.to_json(orient='records'))}, f, indent=1)
+    return report, sorted(recheck)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Diff versions of WALKS.csv and revalidate only what changed.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    diff_parser = commands.add_parser('diff', help='list the walks and fields that changed between two versions')
+    diff_parser.add_argument('old')
+    diff_parser.add_argument('new', nargs='?', default=CURRENT)
+    diff_parser.add_argument('--output', help='write every changed field to this csv')
+    revalidate_parser = commands.add_parser('revalidate', help='re-run the gpx checks for walks changed since the last run')
+    revalidate_parser.add_argument('--version', default=CURRENT)
+    revalidate_parser.add_argument('--gpx-dir', default='./gpx/')
+    revalidate_parser.add_argument('--output', default='validation_report.csv', help='.csv or .json')
+    commands.add_parser('versions', help='list the versions in the store')
+    args = parser.parse_args()
+
+    if args.command == 'versions':
+        ingest_snapshots()
+        print('\n'.join(snapshot_files()))
+    elif args.command == 'diff':
+        diff = diff_snapshots(load_snapshot(args.old), load_snapshot(args.new))
+        if args.output:
+            diff.to_csv(args.output, index=False)
+        with pd.option_context('display.max_rows', None, 'display.max_colwidth', 80, 'display.width', 200):
+            print(summarise_diff(diff).to_string(index=False))
+    else:
+        report, rechecked = revalidate(args.version, args.gpx_dir)
+        write_report(report, args.output)
+        print(f're-checked {len(rechecked)} of {len(report)} walks, report written to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
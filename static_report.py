@@ -0,0 +1,230 @@
+'''Static html pages of every walk, for reviewing without a streamlit session.
+
+One page per walk with its details, check results, elevation profile, map and
+thumbnail gallery, plus an index page per release and one listing the
+releases. Each page is a single html file, with the map and chart drawn by
+the same make_map, poi_fg and plot_layer_altair as the app, and the
+thumbnails embedded (leaflet and vega are loaded from their CDNs, as in the app).
+
+The pages are built across a process pool. Every walk's inputs (its rows in
+the three sheets, gpx file, images and check results) are hashed, and a page
+is only rebuilt when that hash changes:
+    python static_report.py [--release Release3] [--output-dir static_report] [--force]
+'''
+import argparse
+import base64
+import hashlib
+import html
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from app_fncs import load_track, load_simplified_track, make_map, poi_fg, plot_layer_altair, MAP_DETAIL_ZOOM
+from image_manifest import load_manifest, audit_images, walks_issues
+from rules import rule_matrix, failed_rules
+from thumbnails import make_thumbnails
+from validation import validate_walk, check_poi_proximity, PASS, FAIL
+from walk_data import load_walk_data, walk_pois, walk_images
+
+REPORT_DIR = 'static_report'
+# bump when the layout of the pages changes, so every page is rebuilt
+PAGE_VERSION = 1
+PAGE_STYLE = '''body {font-family: sans-serif; margin: 2em; max-width: 1200px}
+table {border-collapse: collapse} td, th {border: 1px solid #ccc; padding: 0.2em 0.5em; text-align: left}
+.fail {color: #c00} .pass {color: #05a}
+.gallery {display: flex; flex-wrap: wrap; gap: 1em} .gallery figure {width: 280px; margin: 0}
+.gallery img {width: 100%} iframe {width: 100%; border: none}'''
+
+
+def page_name(name):
+    return re.sub(r'[^A-Za-z0-9]+', '-', name).strip('-') + '.html'
+
+
+def page(title, body):
+    return (f'<!DOCTYPE html>\n<html><head><meta charset="utf-8"><title>{html.escape(title)}</title>'
+            f'<style>{PAGE_STYLE}</style></head><body>{body}</body></html>\n')
+
+
+def embed(document, height):
+    '''a complete html document, such as a folium map or altair chart, inside an iframe of this page'''
+    return f'<iframe srcdoc="{html.escape(document)}" style="height: {height}px"></iframe>'
+
+
+def walk_job(data, name, rules, poi_check, image_issues, manifest, gpx_dir, img_dir):
+    '''everything the page of a walk is built from, which is also what decides if it needs rebuilding'''
+    walk = data.walk_rows[name].iloc[0].to_dict()
+    images = walk_images(data, name)
+    gpx_file = os.path.join(gpx_dir, str(walk['GeoJson']))
+    gpx_stat = os.stat(gpx_file) if len(str(walk['GeoJson'])) > 1 and os.path.isfile(gpx_file) else None
+    return {
+        'name': name,
+        'walk': walk,
+        'pois': walk_pois(data, name),
+        'images': images,
+        'failed_rules': failed_rules(rules, name),
+        'poi_check': poi_check[poi_check['WALK_Name'] == name],
+        'image_issues': walks_issues(image_issues, [name]).query('issue != "orphaned"'),
+        'gpx_file': gpx_file if gpx_stat else None,
+        'gpx_version': (gpx_stat.st_size, gpx_stat.st_mtime_ns) if gpx_stat else None,
+        'image_mtimes': {os.path.join(img_dir, filename): int(manifest.at[filename, 'mtime_ns'])
+                         for filename in images['FILENAME'] if filename in manifest.index},
+        'gpx_dir': gpx_dir,
+        'img_dir': img_dir,
+    }
+
+
+def fingerprint(job):
+    frames = {key: value.to_json(orient='records') for key, value in job.items() if isinstance(value, pd.DataFrame)}
+    other = {key: value for key, value in job.items() if not isinstance(value, pd.DataFrame)}
+    text = json.dumps([PAGE_VERSION, other, frames], sort_keys=True, default=str)
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+def thumbnail_gallery(images, image_mtimes, img_dir):
+    thumbs = make_thumbnails(list(image_mtimes), mtimes=image_mtimes)
+    figures = []
+    for filename, title in zip(images['FILENAME'], images['Title']):
+        caption = html.escape(str(title))
+        thumb = thumbs.get(os.path.join(img_dir, filename))
+        if thumb is None:
+            figures.append(f'<figure><figcaption class="fail">could not find image {html.escape(filename)}</figcaption></figure>')
+            continue
+        with open(thumb, 'rb') as f:
+            encoded = base64.b64encode(f.read()).decode()
+        figures.append(f'<figure><img src="data:image/jpeg;base64,{encoded}" alt="{caption}"><figcaption>{caption}</figcaption></figure>')
+    return f'<div class="gallery">{"".join(figures)}</div>'
+
+
+def render_walk_page(job):
+    '''the html of one walk's page, and the row of the release index for it'''
+    walk = job['walk']
+    name = job['name']
+    body = [f'<p><a href="index.html">{html.escape(str(walk["ToEvolveTech"]))}</a></p>',
+            f'<h1>{html.escape(name)}</h1>', '<h2>Checks</h2><ul>']
+    body += [f'<li class="fail">Rule failed: {html.escape(description)}</li>' for description in job['failed_rules']]
+
+    gpx = validate_walk(walk, job['gpx_dir'])
+    for check, label, unit in [('distance_km', 'Distance', 'km'), ('highest_point_m', 'Highest point', 'm'), ('ascent_m', 'Ascent', 'm')]:
+        status = gpx[f'{check}_status']
+        body.append(f'<li class="{"pass" if status == PASS else "fail"}">{label}: gpx file '
+                    f'{gpx[f"{check}_gpx"]}{unit}, data {gpx[f"{check}_data"]}{unit} ({status})</li>')
+    for title, distance_m, max_m in zip(job['poi_check']['Title'], job['poi_check']['route_distance_m'],
+                                        job['poi_check']['max_distance_m']):
+        if distance_m > max_m:
+            body.append(f'<li class="fail">POI {html.escape(str(title))} is {distance_m:.0f}m from the route, more than {max_m:.0f}m</li>')
+    issues = job['image_issues']
+    for issue, filename, referenced_by, detail in zip(issues['issue'], issues['FILENAME'], issues['referenced_by'], issues['detail']):
+        source = f' ({referenced_by})' if isinstance(referenced_by, str) else ''
+        body.append(f'<li class="fail">Image {html.escape(filename)}{source} {issue}: {html.escape(str(detail))}</li>')
+    if gpx['error'] is not None:
+        body.append(f'<li class="fail">Could not read the gpx file: {html.escape(gpx["error"])}</li>')
+    body.append('</ul>')
+
+    if job['gpx_file'] and gpx['error'] is None:
+        track = load_track(job['gpx_file'])
+        body.append('<h2>Elevation profile</h2>' + embed(plot_layer_altair(track.dist, track.ele).to_html(), 220))
+        route = load_simplified_track(job['gpx_file'], MAP_DETAIL_ZOOM)
+        route_map = make_map(route.points, track.centre, [walk['StartLocationLat'], walk['StartLocationLng']],
+                             [walk['EndLocationLat'], walk['EndLocationLng']])
+        if len(job['pois']):
+            import folium
+            route_map.add_child(poi_fg(job['pois']))
+            folium.LayerControl().add_to(route_map)
+        body.append('<h2>Map</h2>' + embed(route_map.get_root().render(), 520))
+    elif gpx['error'] is None:
+        body.append(f'<p class="fail">No gpx file for this walk ({html.escape(str(walk["GeoJson"]))})</p>')
+
+    details = pd.DataFrame({'value': walk}).to_html(na_rep='', escape=True)
+    body.append(f'<h2>Details</h2>{details}')
+    if len(job['pois']):
+        body.append('<h2>POIs</h2>' + job['pois'].to_html(index=False, na_rep='', escape=True))
+    body.append(f'<h2>Images ({len(job["images"])})</h2>' + thumbnail_gallery(job['images'], job['image_mtimes'], job['img_dir']))
+
+    n_failed = len(job['failed_rules']) + (not gpx['passed']) + int((job['poi_check']['status'] == FAIL).sum()) + len(job['image_issues'])
+    return page(name, '\n'.join(body)), {'Name': name, 'page': page_name(name), 'gpx_checks_passed': gpx['passed'],
+                                         'failed_rules': len(job['failed_rules']), 'issues': n_failed}
+
+
+def _build_page(job, out_file):
+    text, row = render_walk_page(job)
+    tmp_file = f'{out_file}.{os.getpid()}.tmp'
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_file, out_file)
+    return row
+
+
+def release_index(release, rows):
+    table = ''.join(f'<tr><td><a href="{row["page"]}">{html.escape(row["Name"])}</a></td>'
+                    f'<td class="{"pass" if row["gpx_checks_passed"] else "fail"}">{"yes" if row["gpx_checks_passed"] else "no"}</td>'
+                    f'<td>{row["failed_rules"]}</td><td class="{"fail" if row["issues"] else "pass"}">{row["issues"]}</td></tr>'
+                    for row in rows)
+    return page(release, f'<p><a href="../index.html">All releases</a></p><h1>{html.escape(release)}</h1>'
+                         f'<table><tr><th>Walk</th><th>gpx checks passed</th><th>Rules failed</th><th>Issues</th></tr>{table}</table>')
+
+
+def build_report(releases=None, output_dir=REPORT_DIR, gpx_dir='./gpx/', img_dir='./images', max_workers=None, force=False):
+    '''write the pages of every walk in the releases (all of them by default), only rebuilding
+    walks whose inputs changed. Returns the names of the walks rebuilt'''
+    data = load_walk_data()
+    releases = releases or sorted(data.names_by_release)
+    rules = rule_matrix(gpx_dir=gpx_dir, img_dir=img_dir)
+    poi_check = check_poi_proximity(data.pois, data.walks, gpx_dir)
+    manifest = load_manifest(img_dir)
+    image_issues = audit_images(manifest, data.walks, data.images)
+
+    state_file = os.path.join(output_dir, 'pages.json')
+    try:
+        with open(state_file) as f:
+            state = json.load(f)
+    except FileNotFoundError:
+        state = {}
+
+    todo = []
+    for release in releases:
+        os.makedirs(os.path.join(output_dir, release), exist_ok=True)
+        for name in data.names_by_release.get(release, []):
+            job = walk_job(data, name, rules, poi_check, image_issues, manifest, gpx_dir, img_dir)
+            key = fingerprint(job)
+            out_file = os.path.join(output_dir, release, page_name(name))
+            if force or state.get(name, {}).get('fingerprint') != key or not os.path.isfile(out_file):
+                todo.append((name, key, job, out_file))
+
+    if todo:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            rows = executor.map(_build_page, [job for _, _, job, _ in todo], [out_file for *_, out_file in todo])
+            for (name, key, _, _), row in zip(todo, rows):
+                state[name] = {'fingerprint': key, 'row': row}
+
+    for release in releases:
+        rows = [state[name]['row'] for name in data.names_by_release.get(release, []) if name in state]
+        with open(os.path.join(output_dir, release, 'index.html'), 'w', encoding='utf-8') as f:
+            f.write(release_index(release, rows))
+    links = ''.join(f'<li><a href="{html.escape(release)}/index.html">{html.escape(release)}</a> '
+                    f'({len(data.names_by_release.get(release, []))} walks)</li>' for release in sorted(data.names_by_release))
+    with open(os.path.join(output_dir, 'index.html'), 'w', encoding='utf-8') as f:
+        f.write(page('VAM content checker', f'<h1>Walks by release</h1><ul>{links}</ul>'))
+    with open(state_file, 'w') as f:
+        json.dump(state, f, indent=1)
+    return [name for name, *_ in todo]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--release', action='append', help='only build this release, can be given more than once')
+    parser.add_argument('--output-dir', default=REPORT_DIR)
+    parser.add_argument('--gpx-dir', default='./gpx/')
+    parser.add_argument('--img-dir', default='./images')
+    parser.add_argument('--workers', type=int, default=None, help='number of processes, defaults to the number of cores')
+    parser.add_argument('--force', action='store_true', help='rebuild every page')
+    args = parser.parse_args()
+
+    rebuilt = build_report(args.release, args.output_dir, args.gpx_dir, args.img_dir, args.workers, args.force)
+    print(f'{len(rebuilt)} walk pages rebuilt, open {os.path.join(args.output_dir, "index.html")}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+'''Resized copies of the walk images for the gallery.
+
+Thumbnails are written to THUMBNAIL_DIR, named after the source file, its mtime
+and the target width, so an edited image gets a new thumbnail once its new
+mtime is known (the app takes mtimes from the image manifest, see
+image_manifest.py for how soon that is). Missing thumbnails are generated in
+parallel on first use.
+'''
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageOps
+
+THUMBNAIL_DIR = 'thumbnails'
+THUMBNAIL_WIDTH = 400
+JPEG_QUALITY = 80
+MAX_WORKERS = 4
+
+
+def thumbnail_path(src_file, width=THUMBNAIL_WIDTH, thumbnail_dir=THUMBNAIL_DIR, mtime_ns=None):
+    stem = os.path.splitext(os.path.basename(src_file))[0]
+    if mtime_ns is None:
+        mtime_ns = os.stat(src_file).st_mtime_ns
+    return os.path.join(thumbnail_dir, f'{stem}-{mtime_ns}-{width}.jpg')
+
+
+def make_thumbnail(src_file, width=THUMBNAIL_WIDTH, thumbnail_dir=THUMBNAIL_DIR, mtime_ns=None):
+    '''path of the thumbnail of src_file, creating it if needed'''
+    out_file = thumbnail_path(src_file, width, thumbnail_dir, mtime_ns)
+    if os.path.isfile(out_file):
+        return out_file
+
+    os.makedirs(thumbnail_dir, exist_ok=True)
+    with Image.open(src_file) as img:
+        # let the jpeg decoder skip straight to a reduced scale, much faster than a full decode
+        img.draft('RGB', (width, width))
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail((width, width * 4))
+        img = img.convert('RGB')
+    # write to a temporary file of its own so a concurrent session, or another thread of
+    # this one, never reads half a file
+    fd, tmp_file = tempfile.mkstemp(suffix='.tmp', dir=thumbnail_dir)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            img.save(f, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+        os.replace(tmp_file, out_file)
+    except BaseException:
+        os.remove(tmp_file)
+        raise
+    return out_file
+
+
+def make_thumbnails(src_files, width=THUMBNAIL_WIDTH, thumbnail_dir=THUMBNAIL_DIR, max_workers=MAX_WORKERS, mtimes=None):
+    '''thumbnails for a list of images, generating the missing ones in parallel.
+
+    Returns a dict of source file to thumbnail path, files that are missing or
+    can't be read are left out. mtimes, a dict of source file to mtime such as
+    the image manifest holds, saves checking each source file on disk.'''
+    def safe_thumbnail(src_file):
+        try:
+            return make_thumbnail(src_file, width, thumbnail_dir, None if mtimes is None else mtimes[src_file])
+        except (OSError, ValueError):
+            return None
+
+    if mtimes is None:
+        src_files = [src_file for src_file in src_files if os.path.isfile(src_file)]
+    else:
+        src_files = [src_file for src_file in src_files if src_file in mtimes]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = executor.map(safe_thumbnail, src_files)
+    return {src_file: out_file for src_file, out_file in zip(src_files, results) if out_file is not None}
@@ -0,0 +1,173 @@
+'''Precompiled binary store of the gpx tracks.
+
+Every gpx file is compiled once into a single memory mapped array file
+(rows lat, lon, elevation and cumulative distance, one column per point)
+with a json index of where each track starts. Loading a track from the store
+is then a slice of the memory map rather than an xml parse.
+
+Build or refresh the store from the repository root with
+    python track_store.py
+only files whose mtime and content hash changed are recompiled.
+'''
+import argparse
+import glob
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+
+STORE_DIR = 'track_store'
+INDEX_FILE = 'index.json'
+GPX_DIRS = ['gpx']
+# order of the rows in the arrays file
+FIELDS = ['lat', 'lon', 'ele', 'dist']
+
+
+def file_hash(file_path):
+    with open(file_path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def store_key(file_path, store_dir=STORE_DIR):
+    '''path of a gpx file relative to the directory holding the store, which is how the index is keyed'''
+    root = os.path.dirname(os.path.abspath(store_dir))
+    return os.path.relpath(os.path.abspath(file_path), root).replace(os.sep, '/')
+
+
+class TrackStore:
+    '''read only view of a compiled store, reopened automatically when it is rebuilt'''
+    def __init__(self, store_dir=STORE_DIR):
+        self.store_dir = store_dir
+        self._index_mtime = None
+        self._files = {}
+        self._arrays = None
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        index_file = os.path.join(self.store_dir, INDEX_FILE)
+        try:
+            mtime = os.stat(index_file).st_mtime_ns
+        except FileNotFoundError:
+            self._index_mtime, self._files, self._arrays = None, {}, None
+            return
+        if mtime == self._index_mtime:
+            return
+        with open(index_file) as f:
+            index = json.load(f)
+        try:
+            self._arrays = np.load(os.path.join(self.store_dir, index['arrays']), mmap_mode='r')
+        except FileNotFoundError:
+            # the store was rebuilt twice since this index was read, treat it as empty (tracks
+            # are parsed from the xml) until the next call picks up the current index
+            self._index_mtime, self._files, self._arrays = None, {}, None
+            return
+        self._files = index['files']
+        self._index_mtime = mtime
+
+    def get(self, file_path, mtime_ns=None):
+        '''arrays and metadata of a compiled track, or None if it is missing or stale
+
+        The arrays are views into the memory map, no data is copied.'''
+        with self._lock:
+            self._refresh()
+            entry = self._files.get(store_key(file_path, self.store_dir))
+            if entry is None or (mtime_ns is not None and entry['mtime_ns'] != mtime_ns):
+                return None
+            start, stop = entry['offset'], entry['offset'] + entry['length']
+            arrays = {field: self._arrays[row, start:stop] for row, field in enumerate(FIELDS)}
+            return arrays, entry
+
+
+def build_store(gpx_files, parse_track, store_dir=STORE_DIR, verbose=False):
+    '''compile gpx files into the store, reusing tracks whose mtime or content hash is unchanged
+
+    parse_track is called with the path of each changed file and must return an
+    object with lat, lon, ele, dist, centre and bounds attributes.
+    Returns the number of files that were recompiled.'''
+    os.makedirs(store_dir, exist_ok=True)
+    old = TrackStore(store_dir)
+    old._refresh()
+    old_arrays, old_files = old._arrays, old._files
+
+    files, chunks, offset, compiled = {}, [], 0, 0
+    for gpx_file in gpx_files:
+        key = store_key(gpx_file, store_dir)
+        mtime_ns = os.stat(gpx_file).st_mtime_ns
+        entry = old_files.get(key)
+        if entry is not None and entry['mtime_ns'] != mtime_ns:
+            # touched but maybe not edited, only recompile if the content changed
+            sha1 = file_hash(gpx_file)
+            entry = dict(entry, mtime_ns=mtime_ns) if sha1 == entry['sha1'] else None
+
+        if entry is not None:
+            data = old_arrays[:, entry['offset']:entry['offset'] + entry['length']]
+        else:
+            track = parse_track(gpx_file)
+            data = np.vstack([getattr(track, field) for field in FIELDS])
+            entry = {'mtime_ns': mtime_ns, 'sha1': file_hash(gpx_file),
+                     'centre': track.centre, 'bounds': track.bounds}
+            compiled += 1
+            if verbose:
+                print(f'compiled {key} ({data.shape[1]} points)')
+
+        entry = dict(entry, offset=offset, length=data.shape[1])
+        files[key] = entry
+        chunks.append(data)
+        offset += data.shape[1]
+
+    if compiled == 0 and set(files) == set(old_files) and old_arrays is not None:
+        # nothing to do, but keep the refreshed mtimes of touched files
+        if any(files[key]['mtime_ns'] != old_files[key]['mtime_ns'] for key in files):
+            _write_index(store_dir, files, os.path.basename(old_arrays.filename))
+        return 0
+
+    # write the arrays under a new name so readers of the previous index keep a valid file
+    generation = 0 if old_arrays is None else _generation(old_arrays.filename) + 1
+    arrays_name = f'tracks-{generation}.npy'
+    arrays = np.hstack(chunks) if chunks else np.empty((len(FIELDS), 0))
+    np.save(os.path.join(store_dir, arrays_name), np.ascontiguousarray(arrays, dtype=np.float64))
+    _write_index(store_dir, files, arrays_name)
+    # the previous generation is kept for readers that loaded its index just before this
+    # one was written, only the ones before it are removed
+    for arrays_file in glob.glob(os.path.join(store_dir, 'tracks-*.npy')):
+        if _generation(arrays_file) < generation - 1:
+            try:
+                os.remove(arrays_file)
+            except FileNotFoundError:
+                pass
+    return compiled
+
+
+def _generation(arrays_file):
+    return int(os.path.basename(arrays_file).split('-')[1].split('.')[0])
+
+
+def _write_index(store_dir, files, arrays_name):
+    tmp_file = os.path.join(store_dir, INDEX_FILE + '.tmp')
+    with open(tmp_file, 'w') as f:
+        json.dump({'arrays': arrays_name, 'fields': FIELDS, 'files': files}, f)
+    os.replace(tmp_file, os.path.join(store_dir, INDEX_FILE))
+
+
+def find_gpx_files(gpx_dirs=GPX_DIRS):
+    return sorted(gpx_file for gpx_dir in gpx_dirs
+                  for gpx_file in glob.glob(os.path.join(gpx_dir, '**', '*.gpx'), recursive=True))
+
+
+def main():
+    from app_fncs import parse_track_file
+
+    parser = argparse.ArgumentParser(description='Compile the gpx files into the binary track store.')
+    parser.add_argument('gpx_dirs', nargs='*', default=GPX_DIRS)
+    parser.add_argument('--store-dir', default=STORE_DIR)
+    args = parser.parse_args()
+
+    gpx_files = find_gpx_files(args.gpx_dirs)
+    compiled = build_store(gpx_files, parse_track_file, args.store_dir, verbose=True)
+    print(f'{compiled} of {len(gpx_files)} gpx files compiled into {args.store_dir}')
+
+
+if __name__ == '__main__':
+    main()
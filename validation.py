@@ -0,0 +1,251 @@
+'''Checks of the data capture sheet against the gpx files.
+
+The same distance, highest point and ascent checks shown in the app can be run
+headless for every walk in WALKS.csv, or for one release, e.g.
+    python validation.py --release Release3 --output release3_checks.csv
+'''
+import argparse
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from app_fncs import load_track, load_track_summary
+from rules import rule_matrix
+from walk_data import WALKS_FILE, POIS_FILE, read_walks, read_pois
+
+# relative difference between the gpx file and the sheet above which a check fails
+TOLERANCE = 0.1
+
+# result of a check
+PASS = 'pass'
+FAIL = 'fail'
+NOT_POPULATED = 'not populated'
+NO_GPX = 'no gpx'
+UNKNOWN_WALK = 'unknown walk'
+# the gpx file couldn't be read, the message is in the error column of the report
+ERROR = 'error'
+
+# how far a POI may be from its route when ProximityDistanceMeters is empty
+DEFAULT_POI_DISTANCE_M = 100
+# Irish Transverse Mercator, so distances come out in metres
+PROJECTED_CRS = 'EPSG:2157'
+
+
+class CheckResult(NamedTuple):
+    check: str
+    gpx_value: float
+    data_value: float
+    status: str
+
+
+def check_within_tolerance(check, gpx_value, data_value, tolerance=TOLERANCE):
+    '''compare a value from the gpx file with the sheet, values of 0 or less count as not populated'''
+    if pd.isna(data_value) or data_value <= 0:
+        return CheckResult(check, gpx_value, data_value, NOT_POPULATED)
+    diff = abs((float(data_value) - gpx_value) / float(data_value))
+    return CheckResult(check, gpx_value, data_value, FAIL if diff >= tolerance else PASS)
+
+
+def compare_to_gpx(summary, data_distance_m, data_height_m, data_ascent_m):
+    '''the distance, highest point and total ascent checks for one walk, rounded as shown in the app'''
+    data_dist_km = data_distance_m / 1000 if not pd.isna(data_distance_m) else data_distance_m
+    return [
+        check_within_tolerance('distance_km', round(summary.distance_km, 1), data_dist_km),
+        check_within_tolerance('highest_point_m', round(summary.max_elevation_m, 1), data_height_m),
+        check_within_tolerance('ascent_m', round(summary.ascent_m), data_ascent_m),
+    ]
+
+
+def validate_walk(walk, gpx_dir='./gpx/'):
+    '''run the gpx checks for one row of WALKS.csv, returning one flat dict for the report'''
+    result = {'Name': walk['Name'], 'ToEvolveTech': walk['ToEvolveTech'], 'GeoJson': walk['GeoJson'], 'error': None}
+    gpx_file = os.path.join(gpx_dir, str(walk['GeoJson']))
+    data_values = [('distance_km', walk['Distance'] / 1000), ('highest_point_m', walk['Height']), ('ascent_m', walk['Ascent'])]
+    if len(str(walk['GeoJson'])) > 1 and os.path.isfile(gpx_file):
+        try:
+            checks = compare_to_gpx(load_track_summary(gpx_file),
+                                    walk['Distance'], walk['Height'], walk['Ascent'])
+        except Exception as error:
+            # a malformed or empty gpx file fails this walk, not the whole report
+            result['error'] = f'{type(error).__name__}: {error}'
+            checks = [CheckResult(check, None, data_value, ERROR) for check, data_value in data_values]
+    else:
+        checks = [CheckResult(check, None, data_value, NO_GPX) for check, data_value in data_values]
+    for check in checks:
+        result[f'{check.check}_gpx'] = check.gpx_value
+        result[f'{check.check}_data'] = check.data_value
+        result[f'{check.check}_status'] = check.status
+    result['passed'] = all(check.status == PASS for check in checks)
+    return result
+
+
+def _validate_chunk(walks, gpx_dir):
+    return [validate_walk(walk, gpx_dir) for walk in walks]
+
+
+def validate_walks(walks, gpx_dir='./gpx/', max_workers=None):
+    '''run the gpx checks for every walk in the walks frame, spread over a process pool'''
+    records = walks.to_dict('records')
+    max_workers = max_workers or os.cpu_count() or 1
+    if max_workers == 1 or len(records) < 2:
+        return pd.DataFrame(_validate_chunk(records, gpx_dir))
+
+    # one chunk per worker keeps the pickling overhead low, the walks are interleaved
+    # so the long routes get spread across the workers
+    n_chunks = min(max_workers, len(records))
+    chunks = [records[i::n_chunks] for i in range(n_chunks)]
+    rows = [None] * len(records)
+    with ProcessPoolExecutor(max_workers=n_chunks) as executor:
+        for i, chunk in enumerate(executor.map(_validate_chunk, chunks, [gpx_dir] * n_chunks)):
+            # put the rows back in the order of the sheet
+            rows[i::n_chunks] = chunk
+    return pd.DataFrame(rows)
+
+
+def _project(lat, lon):
+    # geopandas (with pyproj) is slow to import and only needed for the POI check
+    import geopandas as gpd
+    points = gpd.GeoSeries(gpd.points_from_xy(lon, lat), crs='EPSG:4326').to_crs(PROJECTED_CRS)
+    return np.column_stack((points.x.to_numpy(), points.y.to_numpy()))
+
+
+def check_poi_proximity(pois, walks, gpx_dir='./gpx/', default_distance_m=DEFAULT_POI_DISTANCE_M):
+    '''distance of every POI from the route of the walk it belongs to.
+
+    The segments of every route go into one STRtree, which is queried for all the
+    POIs at once; a POI passes if one of its own walk's segments is within its
+    ProximityDistanceMeters (or default_distance_m). Returns the POIs with
+    route_distance_m, max_distance_m and status columns, where the status is
+    pass, fail, no gpx or unknown walk.'''
+    # like geopandas, shapely is only imported by the scripts and pages that check POIs
+    import shapely
+    from shapely import STRtree
+
+    pois = pois.reset_index(drop=True)
+    gpx_by_walk = dict(zip(walks['Name'], walks['GeoJson']))
+
+    # every track, projected in one go, with the walk each segment belongs to
+    route_names, routes = [], []
+    for name in pois['WALK_Name'].dropna().unique():
+        gpx_file = os.path.join(gpx_dir, str(gpx_by_walk.get(name)))
+        if name in gpx_by_walk and os.path.isfile(gpx_file):
+            try:
+                track = load_track(gpx_file)
+            except Exception:
+                # an unreadable gpx file is reported by validate_walk, its POIs have no route here
+                continue
+            if len(track.lat) > 1:
+                route_names.append(name)
+                routes.append(track)
+    route_ids = {name: i for i, name in enumerate(route_names)}
+
+    max_distance = pois['ProximityDistanceMeters'].fillna(default_distance_m).to_numpy(dtype=np.float64)
+    route_distance = np.full(len(pois), np.nan)
+    poi_route = pois['WALK_Name'].map(route_ids).fillna(-1).to_numpy(dtype=np.int64)
+
+    if routes:
+        coords = _project(np.concatenate([track.lat for track in routes]), np.concatenate([track.lon for track in routes]))
+        lengths = np.array([len(track.lat) for track in routes])
+        ends = np.cumsum(lengths)
+        # a segment joins each point to the next one, apart from the last point of every route
+        starts = np.setdiff1d(np.arange(len(coords) - 1), ends[:-1] - 1)
+        segments = shapely.linestrings(np.stack((coords[starts], coords[starts + 1]), axis=1))
+        segment_route = np.repeat(np.arange(len(routes)), lengths - 1)
+        route_lines = np.array([shapely.linestrings(coords[end - n:end]) for n, end in zip(lengths, ends)])
+
+        has_route = poi_route >= 0
+        points = shapely.points(_project(pois['Latitude'].to_numpy(), pois['Longitude'].to_numpy()))
+        tree = STRtree(segments)
+        poi_idx, segment_idx = tree.query(points[has_route], predicate='dwithin', distance=max_distance[has_route])
+        poi_idx = np.flatnonzero(has_route)[poi_idx]
+        own = segment_route[segment_idx] == poi_route[poi_idx]
+        poi_idx, segment_idx = poi_idx[own], segment_idx[own]
+
+        # nearby POIs: the closest of the segments the tree found
+        near = np.full(len(pois), np.inf)
+        np.minimum.at(near, poi_idx, shapely.distance(points[poi_idx], segments[segment_idx]))
+        route_distance[np.isfinite(near)] = near[np.isfinite(near)]
+        # POIs away from their route: the distance to the whole route
+        far = has_route & ~np.isfinite(near)
+        route_distance[far] = shapely.distance(points[far], route_lines[poi_route[far]])
+
+    status = np.where(route_distance <= max_distance, PASS, FAIL).astype(object)
+    status[poi_route < 0] = NO_GPX
+    status[~pois['WALK_Name'].isin(gpx_by_walk).to_numpy()] = UNKNOWN_WALK
+    return pois[['WALK_Name', 'Title', 'Latitude', 'Longitude']].assign(
+        route_distance_m=route_distance.round(1), max_distance_m=max_distance, status=status)
+
+
+_poi_cache = {}
+_poi_cache_lock = threading.Lock()
+
+
+def walk_poi_proximity(name, pois, walks, gpx_dir='./gpx/', pois_file=POIS_FILE, walks_file=WALKS_FILE):
+    '''check_poi_proximity of one walk's POIs, recomputed only when its gpx file or the sheets change'''
+    gpx_file = os.path.join(gpx_dir, str(dict(zip(walks['Name'], walks['GeoJson'])).get(name)))
+    key = (os.stat(pois_file).st_mtime_ns, os.stat(walks_file).st_mtime_ns,
+           os.stat(gpx_file).st_mtime_ns if os.path.isfile(gpx_file) else None)
+    with _poi_cache_lock:
+        cached = _poi_cache.get((name, gpx_dir))
+        if cached is None or cached[0] != key:
+            cached = (key, check_poi_proximity(pois, walks, gpx_dir))
+            _poi_cache[(name, gpx_dir)] = cached
+        return cached[1]
+
+
+def read_release_walks(walks_file=WALKS_FILE, release=None):
+    walks = read_walks(walks_file)
+    if release is not None:
+        walks = walks[walks.ToEvolveTech == release]
+    return walks
+
+
+def write_report(report, output):
+    if output.endswith('.json'):
+        report.to_json(output, orient='records', indent=2)
+    else:
+        report.to_csv(output, index=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check distance, highest point and ascent of every walk against its gpx file.')
+    parser.add_argument('--release', help='only check walks from this release, e.g. Release3')
+    parser.add_argument('--walks', default=WALKS_FILE)
+    parser.add_argument('--gpx-dir', default='./gpx/')
+    parser.add_argument('--output', default='validation_report.csv', help='.csv or .json')
+    parser.add_argument('--workers', type=int, default=None, help='number of processes, defaults to the number of cores')
+    parser.add_argument('--poi-report', help='also check every POI is near its route, writing the results to this .csv or .json')
+    parser.add_argument('--pois', default=POIS_FILE)
+    parser.add_argument('--rules-report', help='also evaluate the sheet rules in rules.py, writing the walk by rule matrix to this .csv or .json')
+    args = parser.parse_args()
+
+    report = validate_walks(read_release_walks(args.walks, args.release), args.gpx_dir, args.workers)
+    write_report(report, args.output)
+    print(f"{int(report['passed'].sum())} of {len(report)} walks passed all checks, report written to {args.output}")
+    for name, error in zip(report['Name'], report['error']):
+        if isinstance(error, str):
+            print(f'could not check {name}: {error}')
+
+    if args.poi_report:
+        walks = read_release_walks(args.walks, args.release)
+        pois = read_pois(args.pois)
+        pois = pois[pois['WALK_Name'].isin(walks['Name'])] if args.release else pois
+        poi_report = check_poi_proximity(pois, read_walks(args.walks), args.gpx_dir)
+        write_report(poi_report, args.poi_report)
+        print(f"{int((poi_report['status'] == PASS).sum())} of {len(poi_report)} POIs are near their route, "
+              f"report written to {args.poi_report}")
+
+    if args.rules_report:
+        matrix = rule_matrix(args.walks, args.gpx_dir)
+        if args.release:
+            matrix = matrix[matrix.index.isin(read_release_walks(args.walks, args.release)['Name'])]
+        write_report(matrix.reset_index(), args.rules_report)
+        print(f"{int(matrix.all(axis=1).sum())} of {len(matrix)} walks pass every rule, report written to {args.rules_report}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+'''Access to the data capture sheets: WALKS.csv, POIs.csv and IMAGES.csv.
+
+The sheets are read once per change of any of the files, with explicit dtypes,
+and the POIs and images are grouped by walk name up front so looking up the
+rows of one walk is a dict lookup rather than a scan of the whole sheet.
+'''
+import os
+import threading
+from typing import NamedTuple
+
+import pandas as pd
+
+WALKS_FILE = 'WALKS.csv'
+POIS_FILE = 'POIs.csv'
+IMAGES_FILE = 'IMAGES.csv'
+
+# columns of WALKS.csv used by the app and their dtypes. The measurements are read as
+# text and parsed by read_walks, see NUMERIC_COLUMNS
+WALK_DTYPES = {
+    'Name': str, 'ShortDescription': str, 'GeneralDescription': str, 'GeoJson': str, 'ShapeName': str,
+    'StartLocationLat': 'float64', 'StartLocationLng': 'float64', 'EndLocationLat': 'float64', 'EndLocationLng': 'float64',
+    'CoverImage': str, 'Duration': str, 'Distance': str, 'Grading': str, 'Height': str, 'Ascent': str,
+    'Gear': str, 'Safety': str, 'CarparkGettingStart': str, 'WayMarked': str, 'DogsAllowed': str, 'Facilities': str,
+    'Accessible': str, 'AccessibleToilet': str, 'AccessibleTerrainDescription': str, 'NearestCarpark': str,
+    'ToEvolveTech': str, 'CoverImageFile': str,
+}
+# measurements in metres. A cell that isn't a number (such as "5.5 km") becomes empty
+# rather than failing the whole sheet, so the checks report that walk as not populated.
+# Columns of whole numbers are nullable so an empty cell doesn't turn them into floats
+NUMERIC_COLUMNS = ['Distance', 'Height', 'Ascent']
+POI_DTYPES = {
+    'TRAIL CODE': str, 'WALK_Name': str, 'Title': str, 'Latitude': 'float64', 'Longitude': 'float64',
+    'ProximityDistanceMeters': 'float64', 'Body': str, 'Image': str,
+}
+IMAGE_DTYPES = {'Trail_CODE': str, 'Name': str, 'CODE': str, 'Title': str, 'FILENAME': str}
+
+
+class Walk(NamedTuple):
+    '''one row of WALKS.csv'''
+    Name: str
+    ShortDescription: str
+    GeneralDescription: str
+    GeoJson: str
+    ShapeName: str
+    StartLocationLat: float
+    StartLocationLng: float
+    EndLocationLat: float
+    EndLocationLng: float
+    CoverImage: str
+    Duration: str
+    Distance: int
+    Grading: str
+    Height: int
+    Ascent: int
+    Gear: str
+    Safety: str
+    CarparkGettingStart: str
+    WayMarked: str
+    DogsAllowed: str
+    Facilities: str
+    Accessible: str
+    AccessibleToilet: str
+    AccessibleTerrainDescription: str
+    NearestCarpark: str
+    ToEvolveTech: str
+    CoverImageFile: str
+
+
+class WalkData(NamedTuple):
+    walks: pd.DataFrame  # WALKS.csv, in sheet order
+    walk_rows: dict  # walk name -> one row frame of WALKS.csv
+    walk_records: dict  # walk name -> Walk
+    names_by_release: dict  # ToEvolveTech -> list of walk names, in sheet order
+    pois_by_walk: dict  # WALK_Name -> frame of POIs.csv
+    images_by_walk: dict  # Name -> frame of IMAGES.csv
+    pois: pd.DataFrame
+    images: pd.DataFrame
+
+
+def read_walks(walks_file=WALKS_FILE):
+    walks = pd.read_csv(walks_file, usecols=list(WALK_DTYPES), dtype=WALK_DTYPES)
+    # keep the column order the app has always shown
+    walks = walks[list(WALK_DTYPES)]
+    for column in NUMERIC_COLUMNS:
+        values = pd.to_numeric(walks[column].str.strip(), errors='coerce')
+        walks[column] = values.astype('Int64') if (values.dropna() % 1 == 0).all() else values
+    return walks.dropna(how='all')
+
+
+def read_pois(pois_file=POIS_FILE):
+    pois = pd.read_csv(pois_file, dtype=POI_DTYPES)
+    pois = pois.dropna(how='all')
+    return pois.dropna(subset=['Latitude', 'Longitude'])
+
+
+def read_images(images_file=IMAGES_FILE):
+    images = pd.read_csv(images_file, dtype=IMAGE_DTYPES)
+    return images.dropna(how='all')
+
+
+def _group(df, column):
+    return {name: group for name, group in df.groupby(column, sort=False)}
+
+
+def build_walk_data(walks, pois, images):
+    walks = walks.drop_duplicates(subset='Name')
+    # an empty measurement is pd.NA in its nullable column, which streamlit's widgets reject,
+    # so the records hold None instead, as the checks and st.metric expect of a missing value
+    rows = (tuple(None if value is pd.NA else value for value in row) for row in walks.itertuples(index=False, name=None))
+    records = {walk.Name: walk for walk in (Walk(*row) for row in rows)}
+    walk_rows = {name: walks.iloc[[i]] for i, name in enumerate(walks['Name'])}
+    names_by_release = {release: list(group['Name']) for release, group in walks.groupby('ToEvolveTech', sort=False)}
+    return WalkData(walks, walk_rows, records, names_by_release,
+                    _group(pois, 'WALK_Name'), _group(images, 'Name'), pois, images)
+
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def load_walk_data(walks_file=WALKS_FILE, pois_file=POIS_FILE, images_file=IMAGES_FILE):
+    '''the three sheets, indexed by walk name. Only re-read when one of the files changes'''
+    files = (walks_file, pois_file, images_file)
+    key = tuple((os.path.abspath(f), os.stat(f).st_mtime_ns) for f in files)
+    with _cache_lock:
+        data = _cache.get(files)
+        if data is None or data[0] != key:
+            data = (key, build_walk_data(read_walks(walks_file), read_pois(pois_file), read_images(images_file)))
+            _cache[files] = data
+        return data[1]
+
+
+def release_walk_names(data, release):
+    return data.names_by_release.get(release, [])
+
+
+def walk_pois(data, name):
+    '''POIs of a walk, an empty frame if it has none'''
+    return data.pois_by_walk.get(name, data.pois.iloc[:0])
+
+
+def walk_images(data, name):
+    '''images of a walk, an empty frame if it has none'''
+    return data.images_by_walk.get(name, data.images.iloc[:0])
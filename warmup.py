@@ -0,0 +1,82 @@
+'''Warm-up of the current release, so the first reviewer after a deploy doesn't
+pay for every import and gpx parse.
+
+Inside the app, start_warmup runs once per server process (streamlit has no
+server start hook, so it is started by the first session) and, on a
+background thread, imports the map and chart libraries then loads every walk
+of the release into the caches: parsed track, summary with the ascent used by
+the gpx checks, simplified route, first page of thumbnails, the sheet rule
+matrix and the overview map routes. Set VAM_WARMUP=0 to turn it off.
+
+As a deploy step, the artifacts kept on disk (the binary track store and the
+thumbnails) can be built before the server starts:
+    python warmup.py [--release Release3]
+'''
+import argparse
+import importlib
+import os
+import threading
+
+from app_fncs import release_geojson, parse_track_file
+from prefetch import warm_walk
+from rules import rule_matrix
+from thumbnails import make_thumbnails
+from track_store import build_store, find_gpx_files
+from walk_data import load_walk_data, release_walk_names, walk_images
+
+WARMUP = os.environ.get('VAM_WARMUP', '1') != '0'
+# imported on the first map or chart otherwise
+HEAVY_MODULES = ['folium', 'folium.plugins', 'streamlit_folium', 'altair', 'geopandas', 'shapely']
+
+
+def warm_imports(modules=HEAVY_MODULES):
+    for module in modules:
+        importlib.import_module(module)
+
+
+def warm_release(release, gpx_dir='./gpx/', img_dir='./images', page_size=12, cancelled=None):
+    '''load every walk of a release into the caches, stopping early if cancelled'''
+    cancelled = cancelled or threading.Event()
+    data = load_walk_data()
+    names = release_walk_names(data, release)
+    rule_matrix(gpx_dir=gpx_dir, img_dir=img_dir)
+    for name in names:
+        if cancelled.is_set():
+            return
+        warm_walk(data.walk_records[name], walk_images(data, name), gpx_dir, img_dir, page_size, cancelled)
+    release_geojson(data.walks[data.walks['Name'].isin(names)], gpx_dir)
+
+
+def start_warmup(release, gpx_dir='./gpx/', img_dir='./images', page_size=12):
+    '''warm the imports and the release on a daemon thread. Returns the thread, or None if turned off'''
+    if not WARMUP:
+        return None
+
+    def run():
+        warm_imports()
+        warm_release(release, gpx_dir, img_dir, page_size)
+
+    thread = threading.Thread(target=run, name='warmup', daemon=True)
+    thread.start()
+    return thread
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--release', default='Release3')
+    parser.add_argument('--img-dir', default='./images')
+    args = parser.parse_args()
+
+    gpx_files = find_gpx_files()
+    compiled = build_store(gpx_files, parse_track_file, verbose=False)
+    print(f'track store: {compiled} of {len(gpx_files)} gpx files compiled')
+
+    data = load_walk_data()
+    names = release_walk_names(data, args.release)
+    images = [os.path.join(args.img_dir, filename) for name in names for filename in walk_images(data, name)['FILENAME']]
+    thumbs = make_thumbnails([img_file for img_file in images if os.path.isfile(img_file)])
+    print(f'thumbnails: {len(thumbs)} images of the {len(names)} walks in {args.release}')
+
+
+if __name__ == '__main__':
+    main()